@@ -0,0 +1,154 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.backends import BACKENDS, get_backend
+from utils.constants import CONSTANTS_MAP
+from utils.polynomial import Polynomial, Poly
+from utils.algorithms import randombytes
+from utils.ring import *
+from kem import KEM
+
+
+# ================================================================
+# Benchmark cases. Every case is a zero-argument callable running one
+# operation, the inputs are prepared once outside of the timed region.
+
+def benchmark_cases(constants: dict, backend: str = "numpy") -> Dict[str, Callable[[], Any]]:
+    kem = KEM(backend, pk_cache_size=0, **constants)
+    arithmetic = get_backend(backend)
+    l, n = constants["SABER_L"], constants["SABER_N"]
+    e_q, e_p, mu = constants["SABER_EQ"], constants["SABER_EP"], constants["SABER_MU"]
+    q, p = 2**e_q, 2**e_p
+
+    PublicKey_cca, SecretKey_cca = kem.KeyGen()
+    _, CipherText_cca = kem.Encaps(PublicKey_cca)
+    seed = randombytes(constants["SABER_SEEDBYTES"])
+    A = gen_matrix(seed, l, n, e_q)
+    s = gen_secret(seed, l, n, mu, q)
+    b = matrix_vector_mul(A, s, q) % p
+    b_bytes = polvec2bs(b, p)
+    coeffs = list(np.random.randint(0, q, n))
+
+    return {
+        "KEM.KeyGen": kem.KeyGen,
+        "KEM.Encaps": lambda: kem.Encaps(PublicKey_cca),
+        "KEM.Decaps": lambda: kem.Decaps(CipherText_cca, SecretKey_cca),
+        "gen_matrix": lambda: gen_matrix(seed, l, n, e_q),
+        "gen_secret": lambda: gen_secret(seed, l, n, mu, q),
+        "matrix_vector_mul": lambda: matrix_vector_mul(A, s, q, arithmetic),
+        "inner_prod": lambda: inner_prod(b, s % p, p, arithmetic),
+        "pol2bs": lambda: pol2bs(b[0], p),
+        "bs2pol": lambda: bs2pol(b_bytes[:32 * e_p]),
+        "polvec2bs": lambda: polvec2bs(b, p),
+        "bs2polvec": lambda: bs2polvec(b_bytes, l),
+        "Polynomial": lambda: Polynomial(coeffs, q),
+        "Poly": lambda: Poly(coeffs, q),
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int = 50, warmup: int = 3) -> Dict[str, float]:
+    """
+    Times repeat calls of fn after warmup calls, returns the throughput, the latency percentiles in milliseconds and the peak memory allocated by a single call in KiB. The memory is traced in a separate call, so that tracemalloc does not slow down the timed calls.
+    """
+
+    for _ in range(warmup):
+        fn()
+
+    timings = np.zeros(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": float(repeat / timings.sum()),
+        "mean_ms": float(timings.mean() * 1e3),
+        "p50_ms": float(np.percentile(timings, 50) * 1e3),
+        "p90_ms": float(np.percentile(timings, 90) * 1e3),
+        "p99_ms": float(np.percentile(timings, 99) * 1e3),
+        "peak_kib": peak / 1024,
+    }
+
+
+def run(params: Sequence[str], repeat: int = 50, only: Optional[Sequence[str]] = None, backend: str = "numpy") -> Dict[str, Any]:
+    results = dict()
+    for name in params:
+        cases = benchmark_cases(CONSTANTS_MAP[name], backend)
+        results[name] = {case: measure(fn, repeat) for case, fn in cases.items() if not only or case in only}
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeat": repeat,
+            "backend": backend,
+        },
+        "results": results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1) -> List[str]:
+    """
+    Returns the descriptions of the cases whose throughput dropped by more than the threshold fraction with respect to the baseline. The cases missing in either of the results are skipped.
+    """
+
+    regressions = list()
+    for name, cases in results["results"].items():
+        for case, stats in cases.items():
+            reference = baseline.get("results", {}).get(name, {}).get(case)
+            if reference is None:
+                continue
+            change = stats["ops_per_sec"] / reference["ops_per_sec"] - 1
+            if change < -threshold:
+                regressions.append(f"{name}/{case}: {reference['ops_per_sec']:.1f} -> {stats['ops_per_sec']:.1f} ops/s ({change:+.1%})")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of the SABER primitives and the KEM for every parameter set.")
+    parser.add_argument("--params", nargs="+", choices=sorted(CONSTANTS_MAP), default=list(CONSTANTS_MAP))
+    parser.add_argument("--only", nargs="+", help="Run only the given cases, e.g. KEM.Decaps gen_matrix.")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="numpy", help="Ring arithmetic backend used by the KEM and the multiplications.")
+    parser.add_argument("--output", help="Write the results to the given JSON file.")
+    parser.add_argument("--baseline", help="Compare the results with the given JSON file written by --output.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative throughput drop reported as a regression.")
+    args = parser.parse_args(argv)
+
+    results = run(args.params, args.repeat, args.only, args.backend)
+    for name, cases in results["results"].items():
+        print(f"[{name}]")
+        for case, stats in cases.items():
+            print(f"  {case:<20} {stats['ops_per_sec']:>10.1f} ops/s  p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms  peak {stats['peak_kib']:8.1f} KiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Sequence, Tuple, Union
+
+from utils.cache import LRUCache
+from utils.constants import CONSTANTS_MAP
+from kem import KEM
+from prepared import PreparedSecretKey
+
+
+# ================================================================
+# Worker side. Every worker process builds its KEM once in the pool
+# initializer, the records of a job are read from and written to shared
+# memory blocks, so only the block names and the chunk bounds are pickled.
+
+_worker_kem = None
+_worker_secret_keys = None
+
+
+def _init_worker(params: str, backend: str):
+    global _worker_kem, _worker_secret_keys
+    _worker_kem = KEM(backend, **CONSTANTS_MAP[params])
+    _worker_secret_keys = LRUCache(max_entries=16)
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # The block is owned and unlinked by the parent process, the worker only maps it
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _run_chunk(kem: KEM, op: str, in_buf: Optional[memoryview], out_buf: memoryview, start: int, stop: int, SecretKey_cca: Optional[Union[bytes, PreparedSecretKey]] = None):
+    in_size, out_size = _record_sizes(kem.constants, op)
+    records = [in_buf[i*in_size:(i + 1)*in_size] for i in range(start, stop)] if in_size else None
+
+    if op == "keygen":
+        results = [PublicKey_cca + SecretKey_cca for PublicKey_cca, SecretKey_cca in kem.keygen_batch(stop - start)]
+    elif op == "encaps":
+        results = [SessionKey_cca + CipherText_cca for SessionKey_cca, CipherText_cca in kem.encaps_batch([bytes(record) for record in records])]
+    elif op == "decaps":
+        results = kem.decaps_batch(records, SecretKey_cca)
+    else:
+        raise ValueError(f"Unknown operation: {op}.")
+
+    out_buf[start*out_size:stop*out_size] = b''.join(results)
+
+
+def _run_chunk_shared(op: str, in_name: Optional[str], out_name: str, start: int, stop: int, SecretKey_cca: Optional[bytes] = None):
+    in_shm = _attach(in_name) if in_name is not None else None
+    out_shm = _attach(out_name)
+    try:
+        if SecretKey_cca is not None:
+            SecretKey_cca = _worker_secret_keys.get_or_create(SecretKey_cca, lambda: _worker_kem.load_secret_key(SecretKey_cca))
+        _run_chunk(_worker_kem, op, in_shm.buf if in_shm is not None else None, out_shm.buf, start, stop, SecretKey_cca)
+    finally:
+        if in_shm is not None:
+            in_shm.close()
+        out_shm.close()
+
+
+def _record_sizes(constants: dict, op: str) -> Tuple[int, int]:
+    return {
+        "keygen": (0, constants["SABER_PUBLICKEYBYTES"] + constants["SABER_SECRETKEYBYTES"]),
+        "encaps": (constants["SABER_PUBLICKEYBYTES"], constants["SABER_KEYBYTES"] + constants["SABER_BYTES_CCA_DEC"]),
+        "decaps": (constants["SABER_BYTES_CCA_DEC"], constants["SABER_KEYBYTES"]),
+    }[op]
+
+
+# ================================================================
+# Parent side.
+
+class KEMExecutor():
+    """
+    Runs bulk KeyGen, Encaps and Decaps jobs on a pool of workers, each with its own KEM for the chosen parameter set from CONSTANTS_MAP. A job is split in chunks of chunk_size records which are processed with the batched KEM methods.
+
+    In the "process" mode the workers are processes, which sidesteps the GIL, and the records are passed through multiprocessing.shared_memory instead of being pickled one by one. In the "thread" mode the workers are threads sharing one KEM, which suits large batches where most of the time is spent in numpy and hashlib with the GIL released.
+    """
+
+    def __init__(self, params: str = "default", workers: Optional[int] = None, mode: str = "process", chunk_size: int = 64, backend: str = "numpy"):
+        assert params in CONSTANTS_MAP, f"Unknown parameter set: {params}."
+        assert mode in ("process", "thread"), "The mode should be either 'process' or 'thread'."
+        assert chunk_size > 0, "The chunk size should be positive."
+
+        self.params = params
+        self.constants = CONSTANTS_MAP[params]
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.backend = backend
+
+        if mode == "process":
+            self._kem = None
+            self._pool: Executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(params, backend))
+            # Start all workers now, so that the first job does not pay for the initialization
+            list(self._pool.map(_worker_pid, range(self.workers)))
+        else:
+            self._kem = KEM(backend, **self.constants)
+            self._pool = ThreadPoolExecutor(self.workers)
+
+    def keygen(self, N: int) -> List[Tuple[bytes, bytes]]:
+        """
+        Generates N key pairs, same as N calls of KEM.KeyGen.
+        """
+
+        out = self._run("keygen", None, N)
+        size = self.constants["SABER_PUBLICKEYBYTES"]
+        return [(record[:size], record[size:]) for record in out]
+
+    def encaps(self, PublicKeys_cca: Sequence[bytes]) -> List[Tuple[bytes, bytes]]:
+        """
+        Encapsulates to N public keys, same as N calls of KEM.Encaps.
+        """
+
+        out = self._run("encaps", PublicKeys_cca, len(PublicKeys_cca))
+        size = self.constants["SABER_KEYBYTES"]
+        return [(record[:size], record[size:]) for record in out]
+
+    def decaps(self, CipherTexts_cca: Sequence[bytes], SecretKey_cca: Union[bytes, PreparedSecretKey]) -> List[bytes]:
+        """
+        Decapsulates N ciphertexts with one secret key, same as N calls of KEM.Decaps. A prepared secret key is accepted only in the "thread" mode.
+        """
+
+        if self.mode == "thread":
+            if not isinstance(SecretKey_cca, PreparedSecretKey):
+                SecretKey_cca = self._kem.load_secret_key(SecretKey_cca)
+        else:
+            assert not isinstance(SecretKey_cca, PreparedSecretKey), "The process workers load the secret key themselves, it should be given as bytes."
+            SecretKey_cca = bytes(SecretKey_cca)
+        return self._run("decaps", CipherTexts_cca, len(CipherTexts_cca), SecretKey_cca)
+
+    def _run(self, op: str, records: Optional[Sequence[bytes]], N: int, SecretKey_cca: Optional[Union[bytes, PreparedSecretKey]] = None) -> List[bytes]:
+        in_size, out_size = _record_sizes(self.constants, op)
+        if records is not None:
+            assert all(len(record) == in_size for record in records), f"Every input record should be of length {in_size} bytes."
+        if N == 0:
+            return []
+        chunks = [(start, min(start + self.chunk_size, N)) for start in range(0, N, self.chunk_size)]
+
+        if self.mode == "thread":
+            in_buf = memoryview(b''.join(records)) if records is not None else None
+            out_buf = memoryview(bytearray(N * out_size))
+            futures = [self._pool.submit(_run_chunk, self._kem, op, in_buf, out_buf, start, stop, SecretKey_cca) for start, stop in chunks]
+            for future in futures:
+                future.result()
+            return [bytes(out_buf[i*out_size:(i + 1)*out_size]) for i in range(N)]
+
+        in_shm = shared_memory.SharedMemory(create=True, size=N * in_size) if records is not None else None
+        out_shm = shared_memory.SharedMemory(create=True, size=N * out_size)
+        try:
+            if in_shm is not None:
+                in_shm.buf[:N * in_size] = b''.join(records)
+            in_name = in_shm.name if in_shm is not None else None
+            futures = [self._pool.submit(_run_chunk_shared, op, in_name, out_shm.name, start, stop, SecretKey_cca) for start, stop in chunks]
+            for future in futures:
+                future.result()
+            return [bytes(out_shm.buf[i*out_size:(i + 1)*out_size]) for i in range(N)]
+        finally:
+            for shm in (in_shm, out_shm):
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self) -> 'KEMExecutor':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
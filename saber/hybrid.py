@@ -0,0 +1,302 @@
+import argparse
+import os
+import struct
+import sys
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from hashlib import sha3_256, shake_256
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.algorithms import randombytes
+from utils.constants import CONSTANTS_MAP
+from kem import KEM
+
+
+# ================================================================
+# Hybrid file encryption. A random file key is wrapped for every recipient
+# with the session key of one KEM.Encaps to its public key, the payload is
+# encrypted once with the file key. The file is the header followed by
+# the chunk records:
+#
+#   header:  magic, version, SABER_L, chunk size, number of recipients,
+#            then per recipient hash_pk || CipherText_cca || wrapped file key || tag
+#   record:  chunk XOR SHAKE256(enc_key || index) || SHA3-256 tag of the chunk
+#
+# Every record but the last holds exactly chunk_size bytes, the last one is
+# shorter (possibly empty) and is tagged as final, so that a truncated file
+# is detected. The tags also cover the hash of the header and the chunk
+# index, so that the chunks can be neither reordered nor moved to another
+# file. Only hashlib is used: SHAKE256 as the keystream and the key
+# derivation function, SHA3-256 (which has no length extension) as the MAC.
+
+MAGIC = b"SABERHYB"
+VERSION = 1
+HEADER = struct.Struct(">8sBBIH")
+FILE_KEY_BYTES = 32
+TAG_BYTES = 16
+DEFAULT_CHUNK_SIZE = 1 << 20
+# The chunk size is read from the header before anything authenticates it, so it bounds the memory a crafted file makes the decryption allocate
+MAX_CHUNK_SIZE = 1 << 26
+
+
+def _derive(key: bytes, label: bytes, length: int = 32) -> bytes:
+    return shake_256(label + key).digest(length)
+
+
+def _xor(data: bytes, keystream: bytes) -> bytes:
+    return np.bitwise_xor(np.frombuffer(data, dtype=np.uint8), np.frombuffer(keystream, dtype=np.uint8)).tobytes()
+
+
+def _wrap_tag(SessionKey_cca: bytes, hash_pk: bytes, CipherText_cca: bytes, wrapped: bytes) -> bytes:
+    return sha3_256(b"saber-hybrid-wrap" + SessionKey_cca + hash_pk + CipherText_cca + wrapped).digest()[:TAG_BYTES]
+
+
+class _ChunkCipher():
+    """
+    Encrypts and authenticates the chunks of one file. Holds no mutable state, so the chunks can be processed by many threads at once, hashlib and numpy release the GIL on the large buffers.
+    """
+
+    def __init__(self, file_key: bytes, header: bytes):
+        self.enc_key = _derive(file_key, b"saber-hybrid-enc")
+        self.mac_key = _derive(file_key, b"saber-hybrid-mac")
+        self.header_hash = sha3_256(header).digest()
+
+    def _tag(self, index: int, final: bool, ciphertext: bytes) -> bytes:
+        mac = sha3_256(self.mac_key + self.header_hash + index.to_bytes(8, "big") + bytes([final]))
+        mac.update(ciphertext)
+        return mac.digest()[:TAG_BYTES]
+
+    def _keystream(self, index: int, length: int) -> bytes:
+        return shake_256(self.enc_key + index.to_bytes(8, "big")).digest(length)
+
+    def seal(self, index: int, final: bool, chunk: bytes) -> bytes:
+        ciphertext = _xor(chunk, self._keystream(index, len(chunk)))
+        return ciphertext + self._tag(index, final, ciphertext)
+
+    def open(self, index: int, final: bool, record: bytes) -> bytes:
+        ciphertext, tag = record[:-TAG_BYTES], record[-TAG_BYTES:]
+        if self._tag(index, final, ciphertext) != tag:
+            raise ValueError(f"The authentication of chunk {index} failed, the file is corrupted or was modified.")
+        return _xor(ciphertext, self._keystream(index, len(ciphertext)))
+
+
+# ================================================================
+# Generator pipeline. The chunks are read lazily, processed by the pool
+# with at most window chunks in flight and yielded in order, so the memory
+# stays bounded by window * chunk_size whatever the size of the file.
+
+def _read_full(source: BinaryIO, size: int) -> bytes:
+    # Raw streams and pipes may return less than asked for before the end of the file
+    data = source.read(size)
+    while data and len(data) < size:
+        more = source.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def _pipeline(fn: Callable[..., bytes], items: Iterable[Tuple], executor: Executor, window: int) -> Iterator[bytes]:
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _plain_chunks(source: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, bool, bytes]]:
+    index = 0
+    while True:
+        chunk = _read_full(source, chunk_size)
+        final = len(chunk) < chunk_size
+        yield index, final, chunk
+        if final:
+            return
+        index += 1
+
+
+def _sealed_records(source: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, bool, bytes]]:
+    index = 0
+    while True:
+        record = _read_full(source, chunk_size + TAG_BYTES)
+        if len(record) < TAG_BYTES:
+            raise ValueError("The file is truncated.")
+        final = len(record) < chunk_size + TAG_BYTES
+        yield index, final, record
+        if final:
+            if source.read(1):
+                raise ValueError("The file has trailing data after the final chunk.")
+            return
+        index += 1
+
+
+def encrypt_chunks(kem: KEM, PublicKeys_cca: Sequence[bytes], source: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE, executor: Optional[Executor] = None, window: int = 8) -> Iterator[bytes]:
+    """
+    Encrypts the source stream to the given recipients, yields the header and then the encrypted chunks. The chunks are processed on the executor when given, in order and with at most window of them in flight.
+    """
+
+    assert 0 < len(PublicKeys_cca) < 2**16, "There should be between 1 and 65535 recipients."
+    assert 0 < chunk_size <= MAX_CHUNK_SIZE, f"The chunk size should be between 1 and {MAX_CHUNK_SIZE} bytes."
+
+    file_key = randombytes(FILE_KEY_BYTES)
+    header = [HEADER.pack(MAGIC, VERSION, kem.params.l, chunk_size, len(PublicKeys_cca))]
+    for PublicKey_cca in PublicKeys_cca:
+        hash_pk = sha3_256(PublicKey_cca).digest()
+        SessionKey_cca, CipherText_cca = kem.Encaps(PublicKey_cca)
+        wrapped = _xor(file_key, _derive(SessionKey_cca, b"saber-hybrid-wrap", FILE_KEY_BYTES))
+        header.append(hash_pk + CipherText_cca + wrapped + _wrap_tag(SessionKey_cca, hash_pk, CipherText_cca, wrapped))
+    header = b''.join(header)
+    yield header
+
+    cipher = _ChunkCipher(file_key, header)
+    if executor is None:
+        yield from (cipher.seal(*chunk) for chunk in _plain_chunks(source, chunk_size))
+    else:
+        yield from _pipeline(cipher.seal, _plain_chunks(source, chunk_size), executor, window)
+
+
+def read_header(kem: KEM, source: BinaryIO) -> Tuple[bytes, int, List[Tuple[bytes, bytes, bytes, bytes]]]:
+    """
+    Reads the header from the source stream, returns its bytes, the chunk size and the (hash_pk, CipherText_cca, wrapped file key, tag) entries of the recipients.
+    """
+
+    fixed = _read_full(source, HEADER.size)
+    if len(fixed) < HEADER.size:
+        raise ValueError("The file is truncated.")
+    magic, version, l, chunk_size, recipients = HEADER.unpack(fixed)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("The file is not encrypted with this module.")
+    if l != kem.params.l:
+        raise ValueError("The file is encrypted for a different parameter set.")
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError("The file has an invalid chunk size.")
+
+    sizes = (kem.params.hash_bytes, kem.params.ciphertext_bytes, FILE_KEY_BYTES, TAG_BYTES)
+    entries = _read_full(source, recipients * sum(sizes))
+    if len(entries) < recipients * sum(sizes):
+        raise ValueError("The file is truncated.")
+
+    parsed = list()
+    for i in range(recipients):
+        entry, fields = entries[i*sum(sizes):(i + 1)*sum(sizes)], list()
+        for size in sizes:
+            fields.append(entry[:size])
+            entry = entry[size:]
+        parsed.append(tuple(fields))
+
+    return fixed + entries, chunk_size, parsed
+
+
+def decrypt_chunks(kem: KEM, SecretKey_cca: bytes, source: BinaryIO, executor: Optional[Executor] = None, window: int = 8) -> Iterator[bytes]:
+    """
+    Decrypts the source stream with the secret key of one of its recipients, yields the decrypted chunks. Raises ValueError when the key is not a recipient or a chunk fails the authentication, the chunks yielded until then should be discarded.
+    """
+
+    header, chunk_size, entries = read_header(kem, source)
+    hash_pk = bytes(SecretKey_cca[kem.params.sk_hash_pk])
+    for entry_hash_pk, CipherText_cca, wrapped, tag in entries:
+        if entry_hash_pk != hash_pk:
+            continue
+        SessionKey_cca = kem.Decaps(CipherText_cca, SecretKey_cca)
+        if _wrap_tag(SessionKey_cca, hash_pk, CipherText_cca, wrapped) != tag:
+            raise ValueError("The file key could not be unwrapped, the header is corrupted.")
+        file_key = _xor(wrapped, _derive(SessionKey_cca, b"saber-hybrid-wrap", FILE_KEY_BYTES))
+        break
+    else:
+        raise ValueError("The secret key is not one of the recipients of the file.")
+
+    cipher = _ChunkCipher(file_key, header)
+    if executor is None:
+        yield from (cipher.open(*record) for record in _sealed_records(source, chunk_size))
+    else:
+        yield from _pipeline(cipher.open, _sealed_records(source, chunk_size), executor, window)
+
+
+def encrypt_stream(kem: KEM, PublicKeys_cca: Sequence[bytes], source: BinaryIO, sink: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1) -> int:
+    "Encrypts the source stream into the sink with workers threads, returns the number of bytes written."
+
+    with ThreadPoolExecutor(workers) as executor:
+        return sum(sink.write(data) for data in encrypt_chunks(kem, PublicKeys_cca, source, chunk_size, executor if workers > 1 else None, 2 * workers))
+
+
+def decrypt_stream(kem: KEM, SecretKey_cca: bytes, source: BinaryIO, sink: BinaryIO, workers: int = 1) -> int:
+    "Decrypts the source stream into the sink with workers threads, returns the number of bytes written."
+
+    with ThreadPoolExecutor(workers) as executor:
+        return sum(sink.write(data) for data in decrypt_chunks(kem, SecretKey_cca, source, executor if workers > 1 else None, 2 * workers))
+
+
+# ================================================================
+# Command line interface. The parameter set is recognized from the length
+# of the key files.
+
+def _kem_for(key: bytes, field: str) -> KEM:
+    for constants in CONSTANTS_MAP.values():
+        if constants[field] == len(key):
+            return KEM(**constants)
+    raise ValueError(f"The key of length {len(key)} bytes does not belong to any parameter set.")
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Streaming file encryption to SABER public keys.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    keygen = commands.add_parser("keygen", help="Generate a key pair into PREFIX.pub and PREFIX.key.")
+    keygen.add_argument("prefix")
+    keygen.add_argument("--params", choices=sorted(CONSTANTS_MAP), default="default")
+
+    encrypt = commands.add_parser("encrypt", help="Encrypt a file or stdin to one or more public keys.")
+    encrypt.add_argument("-r", "--recipient", action="append", required=True, help="Public key file, may be repeated.")
+    encrypt.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    decrypt = commands.add_parser("decrypt", help="Decrypt a file or stdin with a secret key.")
+    decrypt.add_argument("-k", "--key", required=True, help="Secret key file.")
+
+    for command in (encrypt, decrypt):
+        command.add_argument("-i", "--input", help="Input file, stdin when omitted.")
+        command.add_argument("-o", "--output", help="Output file, stdout when omitted.")
+        command.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    args = parser.parse_args(argv)
+    if args.command == "keygen":
+        PublicKey_cca, SecretKey_cca = KEM(**CONSTANTS_MAP[args.params]).KeyGen()
+        with open(args.prefix + ".pub", "wb") as f:
+            f.write(PublicKey_cca)
+        with open(os.open(args.prefix + ".key", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(SecretKey_cca)
+        return
+
+    source = open(args.input, "rb") if args.input else sys.stdin.buffer
+    # The output is written next to the target and renamed only when complete, so that a failed decryption leaves nothing behind
+    sink = open(args.output + ".part", "wb") if args.output else sys.stdout.buffer
+    try:
+        if args.command == "encrypt":
+            PublicKeys_cca = [_read_file(path) for path in args.recipient]
+            encrypt_stream(_kem_for(PublicKeys_cca[0], "SABER_PUBLICKEYBYTES"), PublicKeys_cca, source, sink, args.chunk_size, args.workers)
+        else:
+            SecretKey_cca = _read_file(args.key)
+            decrypt_stream(_kem_for(SecretKey_cca, "SABER_SECRETKEYBYTES"), SecretKey_cca, source, sink, args.workers)
+    except BaseException:
+        if args.output:
+            sink.close()
+            os.remove(args.output + ".part")
+        raise
+    finally:
+        if args.input:
+            source.close()
+    if args.output:
+        sink.close()
+        os.replace(args.output + ".part", args.output)
+
+
+if __name__ == "__main__":
+    main()
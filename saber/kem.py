@@ -1,12 +1,29 @@
+import numpy as np
+
 from utils.algorithms import *
-from typing import Tuple
+from utils import packing
+from utils.cache import DecapsCache, LRUCache
+from utils.instrumentation import instrumented
+from utils.params import ParameterSet, get_parameters
+from typing import List, Optional, Sequence, Tuple, Union
 from pke import PKE
+from prepared import PreparedPublicKey, PreparedSecretKey
 
 class KEM:
     
-    def __init__(self, **constants):
-        self.constants = constants
-        self.pke = PKE(**self.constants)
+    def __init__(self, backend: str = "numpy", cross_check: Optional[str] = None, pk_cache_size: int = 128, pk_cache_bytes: Optional[int] = None, params: Optional[Union[str, ParameterSet]] = None, decaps_cache_size: int = 0, decaps_cache_ttl: float = 30.0, decaps_rejection_ttl: Optional[float] = None, **constants):
+        self.params = get_parameters(params if params is not None else constants)
+        self.constants = self.params.constants
+        self.backend = backend
+        self.pke = PKE(backend, self.params)
+        # With cross_check, every PKE encryption and decryption is repeated with the second backend and the results are asserted to be identical
+        self.cross_check = cross_check
+        self.check_pke = PKE(cross_check, self.params) if cross_check is not None else None
+        self.public_key_cache = LRUCache(pk_cache_size, pk_cache_bytes, sizeof=lambda prepared: prepared.nbytes)
+        # With decaps_cache_size, every secret key loaded with load_secret_key gets its own DecapsCache, which absorbs the retransmitted ciphertexts
+        self.decaps_cache_size = decaps_cache_size
+        self.decaps_cache_ttl = decaps_cache_ttl
+        self.decaps_rejection_ttl = decaps_rejection_ttl
 
     def KeyGen(self) -> Tuple[bytes, bytes]:
         """
@@ -14,56 +31,240 @@ class KEM:
         Function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=34.16) specification.
         """
 
-        PublicKey_cpa, SecretKey_cpa = self.pke.KeyGen()
-        hash_pk = sha3_256(PublicKey_cpa).digest()
-        z = randombytes(self.constants["SABER_KEYBYTES"])
-        SecretKey_cca = z + hash_pk + PublicKey_cpa + SecretKey_cpa
-        PublicKey_cca = PublicKey_cpa
+        PublicKey_cca = np.empty(self.params.public_key_bytes, dtype=np.uint8)
+        SecretKey_cca = np.empty(self.params.secret_key_bytes, dtype=np.uint8)
+        self.keygen_into(PublicKey_cca, SecretKey_cca)
 
-        return PublicKey_cca, SecretKey_cca
+        return PublicKey_cca.tobytes(), SecretKey_cca.tobytes()
 
-    def Encaps(self, PublicKey_cca: bytes) -> Tuple[bytes, bytes]:
+    @instrumented("KEM.KeyGen")
+    def keygen_into(self, PublicKey_cca: packing.Buffer, SecretKey_cca: packing.Buffer):
+        """
+        Same as KeyGen, but writes the key pair into the caller-owned writable buffers of length SABER_PUBLICKEYBYTES and SABER_SECRETKEYBYTES, e.g. bytearray, memoryview or mmap slices.
         """
-        Generates a session key and the ciphertext corresponding the k. 
+
+        PublicKey_cca = packing.view_bytes(PublicKey_cca, self.params.public_key_bytes, writable=True)
+        SecretKey_cca = packing.view_bytes(SecretKey_cca, self.params.secret_key_bytes, writable=True)
+
+        PublicKey_cpa = SecretKey_cca[self.params.sk_pk]
+        self.pke.keygen_into(PublicKey_cpa, SecretKey_cca[self.params.sk_s])
+        SecretKey_cca[self.params.sk_hash_pk] = np.frombuffer(sha3_256(PublicKey_cpa).digest(), dtype=np.uint8)
+        SecretKey_cca[self.params.sk_z] = np.frombuffer(randombytes(self.params.key_bytes), dtype=np.uint8)
+        PublicKey_cca[...] = PublicKey_cpa
+
+    def Encaps(self, PublicKey_cca: Union[bytes, PreparedPublicKey]) -> Tuple[bytes, bytes]:
+        """
+        Generates a session key and the ciphertext corresponding the k. The public key is either given as bytes, expanded through the public key cache, or already prepared with prepare_public_key.
         Function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=34.51) specification.
         """
 
-        m = randombytes(self.constants["SABER_KEYBYTES"])
+        SessionKey_cca = np.empty(self.params.key_bytes, dtype=np.uint8)
+        CipherText_cca = np.empty(self.params.ciphertext_bytes, dtype=np.uint8)
+        self.encaps_into(PublicKey_cca, SessionKey_cca, CipherText_cca)
+
+        return SessionKey_cca.tobytes(), CipherText_cca.tobytes()
+
+    @instrumented("KEM.Encaps")
+    def encaps_into(self, PublicKey_cca: Union[packing.Buffer, PreparedPublicKey], SessionKey_cca: packing.Buffer, CipherText_cca: packing.Buffer):
+        """
+        Same as Encaps, but writes the session key and the ciphertext into the caller-owned writable buffers of length SABER_KEYBYTES and SABER_BYTES_CCA_DEC.
+        """
+
+        if not isinstance(PublicKey_cca, PreparedPublicKey):
+            PublicKey_cca = self.prepare_public_key(PublicKey_cca)
+        SessionKey_cca = packing.view_bytes(SessionKey_cca, self.params.key_bytes, writable=True)
+        CipherText_cca = packing.view_bytes(CipherText_cca, self.params.ciphertext_bytes, writable=True)
+
+        m = randombytes(self.params.key_bytes)
         m = sha3_256(m).digest()
-        hash_pk = sha3_256(PublicKey_cca).digest()
+        hash_pk = PublicKey_cca.hash_pk
         buf = hash_pk + m
         rk = sha3_512(buf).digest()
-        r, k = rk[:self.constants["SABER_KEYBYTES"]], rk[self.constants["SABER_KEYBYTES"]:]
-        CipherText_cca = self.pke.Enc(m, r, PublicKey_cca)
+        r, k = rk[:self.params.key_bytes], rk[self.params.key_bytes:]
+        self.pke.enc_expanded_into(m, r, PublicKey_cca.A, PublicKey_cca.b, CipherText_cca)
+        if self.check_pke is not None:
+            assert np.array_equal(self.check_pke.enc_expanded_into(m, r, PublicKey_cca.A, PublicKey_cca.b), CipherText_cca), self._mismatch("ciphertexts")
         r_prime = sha3_256(CipherText_cca).digest()
         rk_prime = r_prime + k
-        SessionKey_cca = sha3_256(rk_prime).digest()
+        SessionKey_cca[...] = np.frombuffer(sha3_256(rk_prime).digest(), dtype=np.uint8)
+
+    @instrumented("KEM.prepare_public_key")
+    def prepare_public_key(self, PublicKey_cca: bytes) -> PreparedPublicKey:
+        """
+        Returns the public key with its hash, the matrix A and the vector b computed once, so that repeated encapsulations to the same peer skip them. The prepared keys are kept in the bounded public key cache.
+        """
+
+        PublicKey_cca = bytes(PublicKey_cca)
+        assert len(PublicKey_cca) == self.params.public_key_bytes, "The public key has an incorrect length."
 
-        return SessionKey_cca, CipherText_cca
+        def prepare() -> PreparedPublicKey:
+            hash_pk = sha3_256(PublicKey_cca).digest()
+            A, b = self.pke.expand_public_key(PublicKey_cca)
+            return PreparedPublicKey(PublicKey_cca, hash_pk, A, b)
 
-    def Decaps(self, CipherText_cca: bytes, SecretKey_cca: bytes) -> bytes:
+        return self.public_key_cache.get_or_create(PublicKey_cca, prepare)
+
+    def Decaps(self, CipherText_cca: bytes, SecretKey_cca: Union[bytes, PreparedSecretKey]) -> bytes:
         """
-        Returns a secret key by decapsulating the received cipherte.
+        Returns a secret key by decapsulating the received cipherte. The secret key is either given as bytes or already prepared with load_secret_key.
         Function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=35.09) specification.
         """
 
-        def unpack(SecretKey_cca: bytes):
-            remainder = SecretKey_cca
-            z, remainder = remainder[:self.constants["SABER_KEYBYTES"]], remainder[self.constants["SABER_KEYBYTES"]:]
-            hash_pk, remainder = remainder[:self.constants["SABER_HASHBYTES"]], remainder[self.constants["SABER_HASHBYTES"]:]
-            PublicKey_cpa, remainder = remainder[:self.constants["SABER_INDCPA_PUBLICKEYBYTES"]], remainder[self.constants["SABER_INDCPA_PUBLICKEYBYTES"]:]
-            SecretKey_cpa = remainder
+        SessionKey_cca = np.empty(self.params.key_bytes, dtype=np.uint8)
+        self.decaps_into(CipherText_cca, SecretKey_cca, SessionKey_cca)
 
-            return z, hash_pk, PublicKey_cpa, SecretKey_cpa
+        return SessionKey_cca.tobytes()
+
+    @instrumented("KEM.Decaps")
+    def decaps_into(self, CipherText_cca: packing.Buffer, SecretKey_cca: Union[packing.Buffer, PreparedSecretKey], SessionKey_cca: packing.Buffer):
+        """
+        Same as Decaps, but reads the ciphertext from any byte buffer without copying it and writes the session key into the caller-owned writable buffer of length SABER_KEYBYTES.
+        """
+
+        if not isinstance(SecretKey_cca, PreparedSecretKey):
+            SecretKey_cca = self.load_secret_key(SecretKey_cca)
+        CipherText_cca = packing.view_bytes(CipherText_cca, self.params.ciphertext_bytes)
+        SessionKey_cca = packing.view_bytes(SessionKey_cca, self.params.key_bytes, writable=True)
 
-        z, hash_pk, PublicKey_cpa, SecretKey_cpa = unpack(SecretKey_cca)
-        m = self.pke.Dec(CipherText_cca, SecretKey_cpa)
-        buf = hash_pk + m
-        rk = sha3_512(buf).digest()
-        r, k = rk[:self.constants["SABER_KEYBYTES"]], rk[self.constants["SABER_KEYBYTES"]:]
-        CipherText_prime_cca = self.pke.Enc(m, r, PublicKey_cpa)
-        c = verify(CipherText_prime_cca, CipherText_cca, self.constants["SABER_BYTES_CCA_DEC"])
         r_prime = sha3_256(CipherText_cca).digest()
-        SessionKey_cca = sha3_256((r_prime + k) if c == 0 else (r_prime + z)).digest()
+        cache = SecretKey_cca.decaps_cache
+        if cache is not None:
+            cached = cache.get(r_prime)
+            if cached is not None:
+                SessionKey_cca[...] = np.frombuffer(cached, dtype=np.uint8)
+                return
+
+        m = self.pke.dec_expanded_into(CipherText_cca, SecretKey_cca.s)
+        if self.check_pke is not None:
+            assert np.array_equal(self.check_pke.dec_expanded_into(CipherText_cca, SecretKey_cca.s), m), self._mismatch("decrypted messages")
+        buf = SecretKey_cca.hash_pk + m.tobytes()
+        rk = sha3_512(buf).digest()
+        r, k = rk[:self.params.key_bytes], rk[self.params.key_bytes:]
+        CipherText_prime_cca = self.pke.enc_expanded_into(m, r, SecretKey_cca.A, SecretKey_cca.b)
+        if self.check_pke is not None:
+            assert np.array_equal(self.check_pke.enc_expanded_into(m, r, SecretKey_cca.A, SecretKey_cca.b), CipherText_prime_cca), self._mismatch("ciphertexts")
+        c = verify(memoryview(CipherText_prime_cca), memoryview(CipherText_cca), self.params.ciphertext_bytes)
+        K = sha3_256((r_prime + k) if c == 0 else (r_prime + SecretKey_cca.z)).digest()
+        SessionKey_cca[...] = np.frombuffer(K, dtype=np.uint8)
+        if cache is not None:
+            cache.put(r_prime, K, rejected=c != 0)
+
+    @instrumented("KEM.load_secret_key")
+    def load_secret_key(self, SecretKey_cca: packing.Buffer) -> PreparedSecretKey:
+        """
+        Parses the secret key z || hash_pk || PublicKey_cpa || SecretKey_cpa once and expands its parts, so that Decaps with the returned key does only the per-ciphertext work. With decaps_cache_size, the returned key carries a fresh DecapsCache.
+        """
+
+        assert len(SecretKey_cca) == self.params.secret_key_bytes, "The secret key has an incorrect length."
+
+        SecretKey_cca = packing.view_bytes(SecretKey_cca, self.params.secret_key_bytes)
+        A, b = self.pke.expand_public_key(SecretKey_cca[self.params.sk_pk])
+        s = self.pke.expand_secret_key(SecretKey_cca[self.params.sk_s])
+
+        decaps_cache = DecapsCache(self.decaps_cache_size, self.decaps_cache_ttl, self.decaps_rejection_ttl) if self.decaps_cache_size > 0 else None
+
+        return PreparedSecretKey(SecretKey_cca[self.params.sk_z].tobytes(), SecretKey_cca[self.params.sk_hash_pk].tobytes(), s, A, b, decaps_cache)
+
+    def _mismatch(self, what: str) -> str:
+        return f"The {what} computed with the '{self.backend}' and '{self.cross_check}' backends differ."
+
+    # ================================================================
+    # Batched counterparts of KeyGen, Encaps and Decaps built on the batched
+    # PKE methods, the results are equal to N separate calls.
+
+    @instrumented("KEM.keygen_batch")
+    def keygen_batch(self, N: int) -> List[Tuple[bytes, bytes]]:
+        """
+        Generates N public and secret key pairs, same as N calls of KeyGen.
+        """
+
+        if N == 0:
+            return list()
+
+        key_pairs = list()
+        for PublicKey_cpa, SecretKey_cpa in self.pke.keygen_batch(N):
+            hash_pk = sha3_256(PublicKey_cpa).digest()
+            z = randombytes(self.params.key_bytes)
+            key_pairs.append((PublicKey_cpa, z + hash_pk + PublicKey_cpa + SecretKey_cpa))
+
+        return key_pairs
+
+    @instrumented("KEM.encaps_batch")
+    def encaps_batch(self, PublicKeys_cca: Sequence[Union[bytes, PreparedPublicKey]]) -> List[Tuple[bytes, bytes]]:
+        """
+        Encapsulates to N public keys, same as N calls of Encaps. The public keys go through the public key cache.
+        """
+
+        if len(PublicKeys_cca) == 0:
+            return list()
+
+        prepared = [pk if isinstance(pk, PreparedPublicKey) else self.prepare_public_key(pk) for pk in PublicKeys_cca]
+        ms, rs, ks = list(), list(), list()
+        for PublicKey_cca in prepared:
+            m = sha3_256(randombytes(self.params.key_bytes)).digest()
+            rk = sha3_512(PublicKey_cca.hash_pk + m).digest()
+            ms.append(m)
+            rs.append(rk[:self.params.key_bytes])
+            ks.append(rk[self.params.key_bytes:])
+        A = np.stack([PublicKey_cca.A.coeffs for PublicKey_cca in prepared])
+        b = np.stack([PublicKey_cca.b.coeffs for PublicKey_cca in prepared])
+        CipherTexts_cca = self.pke.enc_batch_expanded(ms, rs, A, b)
+        if self.check_pke is not None:
+            assert np.array_equal(self.check_pke.enc_batch_expanded(ms, rs, A, b), CipherTexts_cca), self._mismatch("ciphertexts")
+        CipherTexts_cca = [CipherText_cca.tobytes() for CipherText_cca in CipherTexts_cca]
+
+        return [(sha3_256(sha3_256(CipherText_cca).digest() + k).digest(), CipherText_cca) for CipherText_cca, k in zip(CipherTexts_cca, ks)]
+
+    @instrumented("KEM.decaps_batch")
+    def decaps_batch(self, CipherTexts_cca: Sequence[bytes], SecretKey_cca: Union[bytes, PreparedSecretKey, Sequence[Union[bytes, PreparedSecretKey]]]) -> List[bytes]:
+        """
+        Decapsulates N ciphertexts, same as N calls of Decaps. Receives either a single secret key shared by all ciphertexts or a sequence of N secret keys. The ciphertexts found in the decapsulation caches of their keys are left out of the batch.
+        """
+
+        if len(CipherTexts_cca) == 0:
+            return list()
+
+        if isinstance(SecretKey_cca, (bytes, bytearray, memoryview, PreparedSecretKey)):
+            sk = SecretKey_cca if isinstance(SecretKey_cca, PreparedSecretKey) else self.load_secret_key(SecretKey_cca)
+            keys = [sk] * len(CipherTexts_cca)
+        else:
+            assert len(SecretKey_cca) == len(CipherTexts_cca), "The number of secret keys should match the number of ciphertexts."
+            keys = [sk if isinstance(sk, PreparedSecretKey) else self.load_secret_key(sk) for sk in SecretKey_cca]
+
+        r_primes = [sha3_256(CipherText_cca).digest() for CipherText_cca in CipherTexts_cca]
+        SessionKeys_cca = [sk.decaps_cache.get(r_prime) if sk.decaps_cache is not None else None for sk, r_prime in zip(keys, r_primes)]
+        missed = [i for i, SessionKey_cca in enumerate(SessionKeys_cca) if SessionKey_cca is None]
+        if not missed:
+            return SessionKeys_cca
+        if len(missed) < len(CipherTexts_cca):
+            CipherTexts_cca = [CipherTexts_cca[i] for i in missed]
+            r_primes = [r_primes[i] for i in missed]
+            keys = [keys[i] for i in missed]
+
+        if all(sk is keys[0] for sk in keys):
+            s, A, b = keys[0].s.coeffs, keys[0].A.coeffs, keys[0].b.coeffs
+        else:
+            s = np.stack([sk.s.coeffs for sk in keys])
+            A = np.stack([sk.A.coeffs for sk in keys])
+            b = np.stack([sk.b.coeffs for sk in keys])
+
+        ms = self.pke.dec_batch_expanded(CipherTexts_cca, s)
+        if self.check_pke is not None:
+            assert np.array_equal(self.check_pke.dec_batch_expanded(CipherTexts_cca, s), ms), self._mismatch("decrypted messages")
+        ms = [m.tobytes() for m in ms]
+        rs, ks = list(), list()
+        for sk, m in zip(keys, ms):
+            rk = sha3_512(sk.hash_pk + m).digest()
+            rs.append(rk[:self.params.key_bytes])
+            ks.append(rk[self.params.key_bytes:])
+        CipherTexts_prime_cca = self.pke.enc_batch_expanded(ms, rs, A, b)
+        if self.check_pke is not None:
+            assert np.array_equal(self.check_pke.enc_batch_expanded(ms, rs, A, b), CipherTexts_prime_cca), self._mismatch("ciphertexts")
+
+        for i, CipherText_cca, CipherText_prime_cca, r_prime, sk, k in zip(missed, CipherTexts_cca, CipherTexts_prime_cca, r_primes, keys, ks):
+            c = verify(CipherText_prime_cca.tobytes(), bytes(CipherText_cca), self.params.ciphertext_bytes)
+            SessionKeys_cca[i] = sha3_256((r_prime + k) if c == 0 else (r_prime + sk.z)).digest()
+            if sk.decaps_cache is not None:
+                sk.decaps_cache.put(r_prime, SessionKeys_cca[i], rejected=c != 0)
 
-        return SessionKey_cca
+        return SessionKeys_cca
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from kem import KEM
+
+if TYPE_CHECKING:
+    from executor import KEMExecutor
+
+
+class KeyPairPool():
+    """
+    Bounded pool of ready key pairs of one parameter set, which takes KEM.KeyGen off the request path of the ephemeral handshakes. A background thread refills the pool with KEM.keygen_batch, or with KEMExecutor.keygen when an executor is given, whenever it drains to low_watermark, and stops once it holds high_watermark pairs. Every pair is handed out exactly once and dropped from the pool.
+
+    When the pool is empty, get generates the pair inline and counts the request as starved, so a burst larger than the pool degrades to the plain KeyGen latency instead of waiting for the refill.
+    """
+
+    def __init__(self, kem: KEM, capacity: int = 256, low_watermark: Optional[int] = None, high_watermark: Optional[int] = None, batch_size: int = 32, executor: Optional['KEMExecutor'] = None):
+        low_watermark = capacity // 4 if low_watermark is None else low_watermark
+        high_watermark = capacity if high_watermark is None else high_watermark
+        assert 0 <= low_watermark < high_watermark <= capacity, "The watermarks should satisfy 0 <= low_watermark < high_watermark <= capacity."
+        assert batch_size > 0, "The batch size should be positive."
+
+        self.kem = kem
+        self.executor = executor
+        self.capacity = capacity
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.handed_out = 0
+        self.generated = 0
+        self.starved = 0
+        self.refills = 0
+        self.refill_seconds = 0.0
+        # Lowest fill level since the last stats call, None until a pair is handed out
+        self.min_size: Optional[int] = None
+        self._pairs: deque = deque()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._refill, name="KeyPairPool", daemon=True)
+        self._thread.start()
+
+    def get(self) -> Tuple[bytes, bytes]:
+        """
+        Returns a fresh (PublicKey_cca, SecretKey_cca) pair, same as KEM.KeyGen.
+        """
+
+        with self._condition:
+            if self._error is not None:
+                raise RuntimeError("The key pair pool refill failed.") from self._error
+            assert not self._closed, "The key pair pool is closed."
+            self.handed_out += 1
+            if self._pairs:
+                key_pair = self._pairs.popleft()
+                self.min_size = len(self._pairs) if self.min_size is None else min(self.min_size, len(self._pairs))
+                if len(self._pairs) <= self.low_watermark:
+                    self._condition.notify()
+                return key_pair
+            self.starved += 1
+            self.min_size = 0
+            self._condition.notify()
+
+        return self.kem.KeyGen()
+
+    def wait_filled(self, timeout: Optional[float] = None) -> bool:
+        "Blocks until the pool holds high_watermark pairs, e.g. before the server starts accepting connections."
+
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._pairs) >= self.high_watermark or self._error is not None or self._closed, timeout)
+
+    def _refill(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or len(self._pairs) <= self.low_watermark)
+                if self._closed:
+                    return
+                missing = self.high_watermark - len(self._pairs)
+                self.refills += 1
+
+            while missing > 0:
+                N = min(self.batch_size, missing)
+                start = time.perf_counter()
+                try:
+                    key_pairs = self.executor.keygen(N) if self.executor is not None else self.kem.keygen_batch(N)
+                except BaseException as e:
+                    with self._condition:
+                        self._error = e
+                        self._condition.notify_all()
+                    return
+                with self._condition:
+                    if self._closed:
+                        return
+                    self.refill_seconds += time.perf_counter() - start
+                    self.generated += N
+                    self._pairs.extend(key_pairs)
+                    missing = self.high_watermark - len(self._pairs)
+                    self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        "Returns the fill level, the watermarks and the counters, min_size is the lowest fill level since the last call."
+
+        with self._condition:
+            stats = {
+                "size": len(self._pairs),
+                "fill": len(self._pairs) / self.capacity if self.capacity else 0.0,
+                "capacity": self.capacity,
+                "low_watermark": self.low_watermark,
+                "high_watermark": self.high_watermark,
+                "min_size": len(self._pairs) if self.min_size is None else self.min_size,
+                "handed_out": self.handed_out,
+                "generated": self.generated,
+                "starved": self.starved,
+                "starved_ratio": self.starved / self.handed_out if self.handed_out else 0.0,
+                "refills": self.refills,
+                "refill_seconds": self.refill_seconds,
+            }
+            self.min_size = None
+            return stats
+
+    def close(self):
+        "Stops the refill thread and drops the pairs which were not handed out."
+
+        with self._condition:
+            self._closed = True
+            self._pairs.clear()
+            self._condition.notify_all()
+        self._thread.join()
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def __enter__(self) -> 'KeyPairPool':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
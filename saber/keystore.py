@@ -0,0 +1,330 @@
+import argparse
+import mmap
+import os
+import struct
+import threading
+from hashlib import sha3_256
+from typing import Optional, Sequence, Tuple, Union
+
+from utils import packing
+from utils.cache import LRUCache
+from utils.constants import CONSTANTS_MAP
+from utils.params import ParameterSet
+from kem import KEM
+from prepared import PreparedSecretKey
+
+
+# ================================================================
+# On-disk format. The data file holds a header followed by fixed-size
+# SecretKey_cca records, so the record i lives at a known offset and is
+# read straight from the memory map. The index file is an open addressing
+# hash table from hash_pk to the record number, probed linearly from the
+# first 8 bytes of hash_pk, which are uniformly distributed as it is a
+# SHA3 digest. The data file is the source of truth, an index which is
+# missing, damaged or behind the data file is rebuilt or completed.
+
+DATA_MAGIC = b"SABERKS1"
+INDEX_MAGIC = b"SABERIX1"
+DATA_HEADER = struct.Struct("<8s6I")
+INDEX_HEADER = struct.Struct("<8sQQ")
+HEADER_SIZE = 64
+SLOT_SIZE = 40
+MIN_CAPACITY = 1024
+MAX_LOAD = 0.5
+
+KeyId = Union[int, bytes]
+
+
+def _fingerprint(params: ParameterSet) -> Tuple[int, ...]:
+    return (params.secret_key_bytes, params.l, params.e_q, params.e_p, params.e_t, params.mu)
+
+
+class KeyStore():
+    """
+    Append-only store of the secret keys of one parameter set, backed by a memory-mapped file of fixed-size SecretKey_cca records and an on-disk hash index from hash_pk to the record number at path + ".idx". A key is identified either by its record number, returned by add, or by its 32-byte hash_pk.
+
+    The lookups are O(1) and return memoryviews of the mapped file, nothing is loaded at open. The keys expanded for decapsulation are kept in a small LRU cache. One process appends to the store, any number of processes may open it with writable=False and pick up the new records on their first lookup miss.
+    """
+
+    def __init__(self, path: str, kem: KEM, writable: bool = True, prepared_cache_size: int = 256):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.kem = kem
+        self.writable = writable
+        self.record_size = kem.params.secret_key_bytes
+        self.prepared_keys = LRUCache(prepared_cache_size, sizeof=lambda prepared: prepared.nbytes)
+        self._lock = threading.RLock()
+        self._data_fd = os.open(path, os.O_RDWR | os.O_CREAT if writable else os.O_RDONLY, 0o600)
+        self._index_fd = None
+        self._data = self._index = None
+        self._open_data()
+        self._open_index()
+
+    # ------------------------------------------------------------
+    # Data file.
+
+    def _open_data(self):
+        header = DATA_HEADER.pack(DATA_MAGIC, *_fingerprint(self.kem.params)).ljust(HEADER_SIZE, b'\0')
+        size = os.fstat(self._data_fd).st_size
+        if size == 0:
+            assert self.writable, f"The key store {self.path} is empty."
+            os.pwrite(self._data_fd, header, 0)
+            size = HEADER_SIZE
+        if os.pread(self._data_fd, HEADER_SIZE, 0) != header:
+            raise ValueError(f"{self.path} is not a key store of this parameter set.")
+        self._map_data(size)
+
+    def _map_data(self, size: int):
+        # A record torn by an interrupted append is ignored and overwritten by the next one.
+        # The previous map is not closed, it stays valid for the memoryviews handed out from it.
+        self._count = (size - HEADER_SIZE) // self.record_size
+        self._data = mmap.mmap(self._data_fd, HEADER_SIZE + self._count * self.record_size, access=mmap.ACCESS_READ)
+
+    def _record_view(self, record: int) -> memoryview:
+        if not 0 <= record < self._count:
+            raise IndexError(f"The record {record} is not mapped, the store holds {self._count} records.")
+        start = HEADER_SIZE + record * self.record_size
+        return memoryview(self._data)[start:start + self.record_size]
+
+    # ------------------------------------------------------------
+    # Index file.
+
+    def _open_index(self):
+        try:
+            fd = os.open(self.index_path, os.O_RDWR if self.writable else os.O_RDONLY)
+        except FileNotFoundError:
+            fd = None
+        if fd is not None:
+            magic, capacity, count = INDEX_HEADER.unpack(os.pread(fd, INDEX_HEADER.size, 0))
+            if magic == INDEX_MAGIC and count > self._count:
+                # The records are written before they are indexed, so the data file appended since it was mapped holds them
+                self._map_data(os.fstat(self._data_fd).st_size)
+            valid = magic == INDEX_MAGIC and capacity & (capacity - 1) == 0 and count <= self._count \
+                and os.fstat(fd).st_size == HEADER_SIZE + capacity * SLOT_SIZE
+            if valid:
+                self._attach_index(fd, capacity, count)
+                self._complete_index()
+                return
+            os.close(fd)
+        if not self.writable:
+            raise ValueError(f"The index of {self.path} is missing or damaged, open the store as writable to rebuild it.")
+        self._rebuild_index(self._count)
+
+    def _attach_index(self, fd: int, capacity: int, count: int):
+        if self._index_fd is not None:
+            os.close(self._index_fd)
+        self._index_fd = fd
+        self._index_inode = os.fstat(fd).st_ino
+        self._capacity = capacity
+        self._indexed = count
+        self._index = mmap.mmap(fd, 0, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+
+    def _rebuild_index(self, count: int):
+        capacity = MIN_CAPACITY
+        while count > capacity * MAX_LOAD:
+            capacity *= 2
+        tmp_path = self.index_path + ".tmp"
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(fd, HEADER_SIZE + capacity * SLOT_SIZE)
+        os.pwrite(fd, INDEX_HEADER.pack(INDEX_MAGIC, capacity, 0), 0)
+        self._attach_index(fd, capacity, 0)
+        self._complete_index()
+        self._index.flush()
+        os.replace(tmp_path, self.index_path)
+
+    def _complete_index(self):
+        # Indexes the records appended after the last index update, e.g. by an interrupted add
+        if not self.writable:
+            return
+        for record in range(self._indexed, self._count):
+            hash_pk = bytes(self._record_view(record)[self.kem.params.sk_hash_pk])
+            offset, found = self._probe(hash_pk)
+            if found < 0:
+                self._insert(offset, hash_pk, record)
+
+    def _probe(self, hash_pk: bytes) -> Tuple[int, int]:
+        "Returns the offset of the slot of hash_pk and its record number, or the offset of the first free slot and -1."
+
+        mask = self._capacity - 1
+        slot = int.from_bytes(hash_pk[:8], "little") & mask
+        while True:
+            offset = HEADER_SIZE + slot * SLOT_SIZE
+            stored = int.from_bytes(self._index[offset + 32:offset + SLOT_SIZE], "little")
+            if stored == 0:
+                return offset, -1
+            if self._index[offset:offset + 32] == hash_pk:
+                return offset, stored - 1
+            slot = (slot + 1) & mask
+
+    def _insert(self, offset: int, hash_pk: bytes, record: int):
+        # The hash goes in before the record number, which marks the slot as used
+        self._index[offset:offset + 32] = hash_pk
+        self._index[offset + 32:offset + SLOT_SIZE] = (record + 1).to_bytes(8, "little")
+        self._indexed = max(self._indexed, record + 1)
+        self._index[:INDEX_HEADER.size] = INDEX_HEADER.pack(INDEX_MAGIC, self._capacity, self._indexed)
+
+    # ------------------------------------------------------------
+    # Public interface.
+
+    def add(self, SecretKey_cca: packing.Buffer) -> int:
+        """
+        Appends the secret key and returns its record number. Adding a key which is already stored returns the record number of the stored one.
+        """
+
+        assert self.writable, "The key store is opened as read-only."
+        SecretKey_cca = packing.view_bytes(SecretKey_cca, self.record_size)
+        hash_pk = SecretKey_cca[self.kem.params.sk_hash_pk].tobytes()
+        assert sha3_256(SecretKey_cca[self.kem.params.sk_pk]).digest() == hash_pk, "The hash_pk of the secret key does not match its public key."
+
+        with self._lock:
+            offset, record = self._probe(hash_pk)
+            if record >= 0:
+                return record
+            record = self._count
+            os.pwrite(self._data_fd, SecretKey_cca, HEADER_SIZE + record * self.record_size)
+            self._map_data(HEADER_SIZE + (record + 1) * self.record_size)
+            self._insert(offset, hash_pk, record)
+            if self._count > self._capacity * MAX_LOAD:
+                self._rebuild_index(self._count)
+            return record
+
+    def record(self, key_id: KeyId) -> int:
+        """
+        Returns the record number of the key given by its record number or hash_pk, raises KeyError when it is not stored.
+        """
+
+        with self._lock:
+            found = self._find(key_id)
+            if found < 0:
+                self.refresh()
+                found = self._find(key_id)
+        if found < 0:
+            raise KeyError(key_id)
+        return found
+
+    def _find(self, key_id: KeyId) -> int:
+        if isinstance(key_id, int):
+            return key_id if 0 <= key_id < self._count else -1
+        hash_pk = bytes(key_id)
+        _, found = self._probe(hash_pk)
+        if found >= self._count:
+            # Indexed by another process after the last refresh, the record is not mapped yet
+            return -1
+        if found < 0:
+            # The records appended by another process after its last index update are not indexed yet
+            for record in range(self._indexed, self._count):
+                if self._record_view(record)[self.kem.params.sk_hash_pk] == hash_pk:
+                    return record
+        return found
+
+    def refresh(self):
+        """
+        Maps the records appended since the store was opened, by this or another process.
+        """
+
+        with self._lock:
+            # The index is read before the data file is mapped, as the records are written before they are indexed
+            if os.stat(self.index_path).st_ino != self._index_inode:
+                self._open_index()
+            else:
+                self._indexed = INDEX_HEADER.unpack(self._index[:INDEX_HEADER.size])[2]
+            size = os.fstat(self._data_fd).st_size
+            if (size - HEADER_SIZE) // self.record_size != self._count:
+                self._map_data(size)
+            self._indexed = min(self._indexed, self._count)
+            self._complete_index()
+
+    def secret_key(self, key_id: KeyId) -> memoryview:
+        "Returns the SecretKey_cca record as a read-only memoryview of the mapped file."
+
+        record = self.record(key_id)
+        with self._lock:
+            return self._record_view(record)
+
+    def public_key(self, key_id: KeyId) -> memoryview:
+        "Returns the PublicKey_cca embedded in the secret key record as a read-only memoryview of the mapped file."
+
+        return self.secret_key(key_id)[self.kem.params.sk_pk]
+
+    def prepared(self, key_id: KeyId) -> PreparedSecretKey:
+        "Returns the expanded secret key from the LRU cache, expanding it on a miss."
+
+        record = self.record(key_id)
+        return self.prepared_keys.get_or_create(record, lambda: self.kem.load_secret_key(self.secret_key(record)))
+
+    def decaps(self, CipherText_cca: packing.Buffer, key_id: KeyId) -> bytes:
+        """
+        KEM.Decaps with the stored secret key given by its record number or hash_pk.
+        """
+
+        return self.kem.Decaps(CipherText_cca, self.prepared(key_id))
+
+    def decaps_into(self, CipherText_cca: packing.Buffer, key_id: KeyId, SessionKey_cca: packing.Buffer):
+        """
+        KEM.decaps_into with the stored secret key given by its record number or hash_pk.
+        """
+
+        self.kem.decaps_into(CipherText_cca, self.prepared(key_id), SessionKey_cca)
+
+    def flush(self):
+        "Writes the appended records and the index to the disk."
+
+        with self._lock:
+            if self.writable:
+                self._index.flush()
+                os.fsync(self._data_fd)
+
+    def close(self):
+        # The maps are left to the garbage collector, so that the memoryviews handed out remain valid
+        with self._lock:
+            self.flush()
+            self._data = self._index = None
+            for fd in (self._data_fd, self._index_fd):
+                os.close(fd)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key_id: KeyId) -> bool:
+        try:
+            self.record(key_id)
+        except KeyError:
+            return False
+        return True
+
+    def __enter__(self) -> 'KeyStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ================================================================
+# Command line interface.
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="SABER secret key store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Generate key pairs and append them to the store.")
+    generate.add_argument("--count", type=int, default=1000)
+    generate.add_argument("--batch", type=int, default=256, help="Number of key pairs generated at once with KEM.keygen_batch.")
+
+    info = commands.add_parser("info", help="Print the number of keys in the store.")
+
+    for command in (generate, info):
+        command.add_argument("path")
+        command.add_argument("--params", choices=sorted(CONSTANTS_MAP), default="default")
+
+    args = parser.parse_args(argv)
+    kem = KEM(**CONSTANTS_MAP[args.params])
+    with KeyStore(args.path, kem, writable=args.command == "generate") as store:
+        if args.command == "generate":
+            for start in range(0, args.count, args.batch):
+                for _, SecretKey_cca in kem.keygen_batch(min(args.batch, args.count - start)):
+                    store.add(SecretKey_cca)
+        print(f"{args.path}: {len(store)} {args.params} keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,25 @@
-from utils.polynomial import Polynomial
-from utils.algorithms import *
-from typing import Tuple
+import numpy as np
+
+from utils.polynomial import PolyVec, PolyMatrix
+from utils.algorithms import randombytes, shake_128
+from utils.ring import *
+from utils import instrumentation, packing, sampling
+from utils.backends import get_backend
+from utils.instrumentation import instrumented
+from utils.params import ParameterSet, get_parameters
+from typing import List, Optional, Sequence, Tuple, Union
 
 class PKE:
 
-    def __init__(self, **constants):
-        self.constants = constants
-        self.n = self.constants["SABER_N"]
-        self.l = self.constants["SABER_L"]
-        self.q = 2**self.constants["SABER_EQ"]
-        self.p = 2**self.constants["SABER_EP"]
-        self.t = 2**self.constants["SABER_ET"]
-        self.h1 = Polynomial([
-            2**(self.constants["SABER_EQ"] - self.constants["SABER_EP"] - 1)
-        ] * self.constants["SABER_N"], self.q)
-        self.h2 = Polynomial([
-            2**(self.constants["SABER_EP"] - 2) -\
-            2**(self.constants["SABER_EP"] - self.constants["SABER_ET"] - 1) +\
-            2**(self.constants["SABER_EQ"] - self.constants["SABER_EP"] - 1)
-        ] * self.constants["SABER_N"], self.q)
-        self.h = [self.h1 for _ in range(self.constants["SABER_L"])]
+    def __init__(self, backend: str = "numpy", params: Optional[Union[str, ParameterSet]] = None, **constants):
+        self.params = get_parameters(params if params is not None else constants)
+        self.constants = self.params.constants
+        self.backend = get_backend(backend)
+        self.n = self.params.n
+        self.l = self.params.l
+        self.q = self.params.q
+        self.p = self.params.p
+        self.t = self.params.t
 
     def KeyGen(self) -> Tuple[bytes, bytes]:
         """
@@ -27,42 +27,72 @@ class PKE:
         Function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=32.20) specification.
         """
 
-        seed_A = randombytes(self.constants["SABER_SEEDBYTES"])
-        seed_A = shake_128(seed_A).digest(self.constants["SABER_SEEDBYTES"])
-        seed_s = randombytes(self.constants["SABER_NOISE_SEEDBYTES"])
-        A = gen_matrix(seed_A, self.l, self.n, self.constants["SABER_EQ"])
-        s = gen_secret(seed_s, self.l, self.n, self.constants["SABER_MU"], self.q)
-        b = matrix_vector_mul(transpose_matrix(A), s, self.q)
-        b = [b[i] + self.h[i] for i in range(self.l)]
-        b_p = [shiftright(poly, self.constants["SABER_EQ"] - self.constants["SABER_EP"]) % self.p for poly in b]
-        SecretKey_cpa = polvec2bs(s, self.q)
-        pk = polvec2bs(b_p, self.p)
-        PublicKey_cpa = seed_A + pk
+        PublicKey_cpa = np.empty(self.params.indcpa_public_key_bytes, dtype=np.uint8)
+        SecretKey_cpa = np.empty(self.params.indcpa_secret_key_bytes, dtype=np.uint8)
+        self.keygen_into(PublicKey_cpa, SecretKey_cpa)
+        PublicKey_cpa, SecretKey_cpa = PublicKey_cpa.tobytes(), SecretKey_cpa.tobytes()
 
         return PublicKey_cpa, SecretKey_cpa
 
+    @instrumented("PKE.KeyGen")
+    def keygen_into(self, PublicKey_cpa: np.ndarray, SecretKey_cpa: np.ndarray):
+        """
+        Same as KeyGen, but writes the keys into the given uint8 arrays of length SABER_INDCPA_PUBLICKEYBYTES and SABER_INDCPA_SECRETKEYBYTES.
+        """
+
+        seed_A = randombytes(self.params.seed_bytes)
+        seed_A = shake_128(seed_A).digest(self.params.seed_bytes)
+        seed_s = randombytes(self.params.noise_seed_bytes)
+        A = gen_matrix(seed_A, self.l, self.n, self.params.e_q)
+        s = gen_secret(seed_s, self.l, self.n, self.params.mu, self.q)
+        b = matrix_vector_mul(transpose_matrix(A), s, self.q, self.backend)
+        PublicKey_cpa[self.params.pk_seed] = np.frombuffer(seed_A, dtype=np.uint8)
+        with instrumentation.stage("round_pack"):
+            packing.pack_rounded_polvec(b.coeffs, self.params.h1, self.params.e_q, self.params.e_p, PublicKey_cpa[self.params.pk_b])
+        SecretKey_cpa[...] = packing.pack_polvec(s.coeffs, self.params.e_q)
+
     def Enc(self, m: bytes, seed_s_prime: bytes, PublicKey_cpa: bytes) -> bytes:
         """
         Receives a 256-bit message m, a random seed of length SABER SEEDBYTES and the public key PublicKey_cpa as the inputs and computes the corresponding ciphertext CipherTextcpa.
         Function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=32.67) specification.
         """
 
-        assert len(m) == 32, "The message encrypted with PKE should be of length 256 bits (32 bytes)."
+        A, b = self.expand_public_key(PublicKey_cpa)
+
+        return self.enc_expanded(m, seed_s_prime, A, b)
+
+    @instrumented("PKE.expand_public_key")
+    def expand_public_key(self, PublicKey_cpa: bytes) -> Tuple[PolyMatrix, PolyVec]:
+        """
+        Expands the public key into the matrix A generated from seed_A and the decoded vector b. Both depend only on the public key, so they can be computed once and reused by enc_expanded.
+        """
 
-        seed_A, pk = PublicKey_cpa[:self.constants["SABER_SEEDBYTES"]], PublicKey_cpa[self.constants["SABER_SEEDBYTES"]:]
-        A = gen_matrix(seed_A, self.l, self.n, self.constants["SABER_EQ"])
-        s_prime = gen_secret(seed_s_prime, self.l, self.n, self.constants["SABER_MU"], self.q)
-        b_prime = matrix_vector_mul(A, s_prime, self.q)
-        b_prime = [b_prime[i] + self.h[i] for i in range(self.l)]
-        b_prime = [shiftright(poly, self.constants["SABER_EQ"] - self.constants["SABER_EP"]) % self.p  for poly in b_prime]
+        seed_A, pk = PublicKey_cpa[self.params.pk_seed], PublicKey_cpa[self.params.pk_b]
+        A = gen_matrix(seed_A, self.l, self.n, self.params.e_q)
         b = bs2polvec(pk, self.l)
-        v_prime = inner_prod(b, [poly % self.p for poly in s_prime], self.p)
-        m_p = bs2pol(m)
-        m_p = shiftleft(m_p % self.p, self.constants["SABER_EP"] - 1)
-        c_m = shiftright(v_prime - (m_p % self.p) + (self.h1 % self.p), self.constants["SABER_EP"] - self.constants["SABER_ET"])
-        CipherText_cpa = pol2bs(c_m % self.t, self.t) + polvec2bs(b_prime, self.p)
 
-        return CipherText_cpa
+        return A, b
+
+    def enc_expanded(self, m: bytes, seed_s_prime: bytes, A: PolyMatrix, b: PolyVec) -> bytes:
+        """
+        Same as Enc, but receives the public key already expanded by expand_public_key.
+        """
+
+        return self.enc_expanded_into(m, seed_s_prime, A, b).tobytes()
+
+    @instrumented("PKE.Enc")
+    def enc_expanded_into(self, m: packing.Buffer, seed_s_prime: packing.Buffer, A: PolyMatrix, b: PolyVec, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Same as enc_expanded, but accepts any byte buffers and returns the ciphertext as a uint8 array, written into out when given.
+        """
+
+        assert len(m) == 32, "The message encrypted with PKE should be of length 256 bits (32 bytes)."
+
+        s_prime = gen_secret(seed_s_prime, self.l, self.n, self.params.mu, self.q)
+        b_prime = matrix_vector_mul(A, s_prime, self.q, self.backend)
+        v_prime = inner_prod(b, s_prime % self.p, self.p, self.backend)
+
+        return self.pack_ciphertext(v_prime.coeffs, b_prime.coeffs, m, out)
 
     def Dec(self, CipherText_cpa: bytes, SecretKey_cpa: bytes) -> bytes:
         """
@@ -70,13 +100,157 @@ class PKE:
         Function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=32.79) specification
         """
 
-        s = bs2polvec(SecretKey_cpa, self.l)
-        c_m, c_t = CipherText_cpa[:32*self.constants["SABER_ET"]], CipherText_cpa[32*self.constants["SABER_ET"]:]
+        s = self.expand_secret_key(SecretKey_cpa)
+
+        return self.dec_expanded(CipherText_cpa, s)
+
+    @instrumented("PKE.expand_secret_key")
+    def expand_secret_key(self, SecretKey_cpa: bytes) -> PolyVec:
+        """
+        Decodes the secret key into the secret vector s, so that it can be computed once and reused by dec_expanded.
+        """
+
+        return bs2polvec(SecretKey_cpa, self.l)
+
+    def dec_expanded(self, CipherText_cpa: bytes, s: PolyVec) -> bytes:
+        """
+        Same as Dec, but receives the secret key already decoded by expand_secret_key.
+        """
+
+        return self.dec_expanded_into(CipherText_cpa, s).tobytes()
+
+    @instrumented("PKE.Dec")
+    def dec_expanded_into(self, CipherText_cpa: packing.Buffer, s: PolyVec, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Same as dec_expanded, but reads the ciphertext from any byte buffer without copying it and returns the message as a uint8 array, written into out when given.
+        """
+
+        CipherText_cpa = packing.view_bytes(CipherText_cpa, self.params.ciphertext_bytes)
+        c_m, c_t = CipherText_cpa[self.params.ct_m], CipherText_cpa[self.params.ct_b]
         c_m = bs2pol(c_m)
-        c_m = shiftleft(c_m % self.p, self.constants["SABER_EP"] - self.constants["SABER_ET"])
         b_prime = bs2polvec(c_t, self.l)
-        v = inner_prod(b_prime, [poly % self.p for poly in s], self.p)
-        m_prime = shiftright(v - c_m % self.p + self.h2 % self.p, self.constants["SABER_EP"] - 1)
-        m = pol2bs(m_prime % 2, 2)
+        v = inner_prod(b_prime, s % self.p, self.p, self.backend)
+
+        return self.pack_message(v.coeffs, c_m.coeffs, out)
+
+    # ================================================================
+    # Fused output kernels shared by the single and the batched Enc and Dec.
+    # They go from the raw products straight to the packed bytes, replacing
+    # the chains of the rounding steps and the temporary polynomials.
+
+    @instrumented("round_pack")
+    def pack_ciphertext(self, v_prime: np.ndarray, b_prime: np.ndarray, m: packing.Buffer, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Rounds and packs the products v_prime = <b, s'> mod p of shape (..., 256) and b_prime = A s' mod q of shape (..., l, 256) together with the messages m of shape (..., 32) into the ciphertexts of shape (..., SABER_BYTES_CCA_DEC), written into out when given.
+        """
+
+        if out is None:
+            out = np.empty(b_prime.shape[:-2] + (self.params.ciphertext_bytes, ), dtype=np.uint8)
+        packing.pack_rounded_poly(v_prime, self.params.h1, self.params.e_p, self.params.e_t, out[..., self.params.ct_m], flip=m)
+        packing.pack_rounded_polvec(b_prime, self.params.h1, self.params.e_q, self.params.e_p, out[..., self.params.ct_b])
+
+        return out
+
+    @instrumented("round_pack")
+    def pack_message(self, v: np.ndarray, c_m: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Rounds and packs the products v = <b', s> mod p of shape (..., 256) with the decoded ciphertext polynomials c_m into the messages of shape (..., 32), written into out when given.
+        """
+
+        v = v - (c_m << np.uint16(self.params.shift_t))
+
+        return packing.pack_rounded_poly(v, self.params.h2, self.params.e_p, 1, out)
+
+    # ================================================================
+    # Batched counterparts of KeyGen, Enc and Dec. The N inputs are stacked
+    # along a leading axis and every stage runs once on the (N, l, 256)
+    # arrays, the results are equal to N separate calls. The stages are
+    # recorded under the same names as in the single calls.
+
+    @instrumented("PKE.keygen_batch")
+    def keygen_batch(self, N: int) -> List[Tuple[bytes, bytes]]:
+        """
+        Generates N public and secret key pairs, same as N calls of KeyGen.
+        """
+
+        seeds_A, seeds_s = [], []
+        for _ in range(N):
+            seed_A = randombytes(self.params.seed_bytes)
+            seeds_A.append(shake_128(seed_A).digest(self.params.seed_bytes))
+            seeds_s.append(randombytes(self.params.noise_seed_bytes))
+        A = sampling.gen_matrix_batch(seeds_A, self.l, self.n, self.params.e_q)
+        s = sampling.gen_secret_batch(seeds_s, self.l, self.n, self.params.mu, self.q)
+        with instrumentation.stage("matrix_vector_mul"):
+            b = self.backend.matrix_vector_mul(A.swapaxes(-3, -2), s, self.q)
+        with instrumentation.stage("polvec2bs"):
+            SecretKey_cpa = packing.pack_polvec(s, self.params.e_q)
+        with instrumentation.stage("round_pack"):
+            pk = packing.pack_rounded_polvec(b, self.params.h1, self.params.e_q, self.params.e_p)
+
+        return [(seeds_A[i] + pk[i].tobytes(), SecretKey_cpa[i].tobytes()) for i in range(N)]
+
+    @instrumented("PKE.expand_public_key_batch")
+    def expand_public_key_batch(self, PublicKeys_cpa: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Expands N public keys into the matrices A of shape (N, l, l, 256) and the vectors b of shape (N, l, 256).
+        """
+
+        seeds_A = [PublicKey_cpa[self.params.pk_seed] for PublicKey_cpa in PublicKeys_cpa]
+        pk = packing.stack_bytes([PublicKey_cpa[self.params.pk_b] for PublicKey_cpa in PublicKeys_cpa])
+        A = sampling.gen_matrix_batch(seeds_A, self.l, self.n, self.params.e_q)
+        with instrumentation.stage("bs2polvec"):
+            b = packing.unpack_polvec(pk, self.params.e_p, self.l)
+
+        return A, b
+
+    def enc_batch(self, ms: Sequence[bytes], seeds_s_prime: Sequence[bytes], PublicKeys_cpa: Sequence[bytes]) -> List[bytes]:
+        """
+        Encrypts N messages with N seeds under N public keys, same as N calls of Enc.
+        """
+
+        A, b = self.expand_public_key_batch(PublicKeys_cpa)
+
+        return [CipherText_cpa.tobytes() for CipherText_cpa in self.enc_batch_expanded(ms, seeds_s_prime, A, b)]
+
+    @instrumented("PKE.enc_batch")
+    def enc_batch_expanded(self, ms: Sequence[bytes], seeds_s_prime: Sequence[bytes], A: np.ndarray, b: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Same as enc_batch, but receives the expanded public keys of shape (..., l, l, 256) and (..., l, 256), a single key broadcasts over the batch. Returns the ciphertexts as a uint8 array of shape (N, SABER_BYTES_CCA_DEC), written into out when given.
+        """
+
+        assert all(len(m) == 32 for m in ms), "The message encrypted with PKE should be of length 256 bits (32 bytes)."
+
+        s_prime = sampling.gen_secret_batch(seeds_s_prime, self.l, self.n, self.params.mu, self.q)
+        with instrumentation.stage("matrix_vector_mul"):
+            b_prime = self.backend.matrix_vector_mul(A, s_prime, self.q)
+        with instrumentation.stage("inner_prod"):
+            v_prime = self.backend.inner_prod(b, s_prime & (self.p - 1), self.p)
+
+        return self.pack_ciphertext(v_prime, b_prime, packing.stack_bytes(ms), out)
+
+    def dec_batch(self, CipherTexts_cpa: Sequence[bytes], SecretKeys_cpa: Sequence[bytes]) -> List[bytes]:
+        """
+        Decrypts N ciphertexts with N secret keys, same as N calls of Dec.
+        """
+
+        with instrumentation.stage("bs2polvec"):
+            s = packing.unpack_polvec(packing.stack_bytes(SecretKeys_cpa), self.params.e_q, self.l)
+
+        return [m.tobytes() for m in self.dec_batch_expanded(CipherTexts_cpa, s)]
+
+    @instrumented("PKE.dec_batch")
+    def dec_batch_expanded(self, CipherTexts_cpa: Sequence[bytes], s: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Same as dec_batch, but receives the decoded secret vectors of shape (..., l, 256), a single key broadcasts over the batch. Returns the messages as a uint8 array of shape (N, 32), written into out when given.
+        """
+
+        CipherText_cpa = packing.stack_bytes(CipherTexts_cpa)
+        c_m, c_t = CipherText_cpa[:, self.params.ct_m], CipherText_cpa[:, self.params.ct_b]
+        with instrumentation.stage("bs2pol"):
+            c_m = packing.unpack_poly(c_m, self.params.e_t)
+        with instrumentation.stage("bs2polvec"):
+            b_prime = packing.unpack_polvec(c_t, self.params.e_p, self.l)
+        with instrumentation.stage("inner_prod"):
+            v = self.backend.inner_prod(b_prime, s & (self.p - 1), self.p)
 
-        return m
\ No newline at end of file
+        return self.pack_message(v, c_m, out)
@@ -0,0 +1,42 @@
+from typing import Optional
+
+from utils.cache import DecapsCache
+from utils.polynomial import PolyMatrix, PolyVec
+
+
+class PreparedPublicKey():
+    """
+    Public key expanded once for repeated encapsulations. Holds the public key bytes, their hash hash_pk, the matrix A generated from seed_A and the decoded vector b.
+    """
+
+    __slots__ = ("PublicKey_cca", "hash_pk", "A", "b")
+
+    def __init__(self, PublicKey_cca: bytes, hash_pk: bytes, A: PolyMatrix, b: PolyVec):
+        self.PublicKey_cca = PublicKey_cca
+        self.hash_pk = hash_pk
+        self.A = A
+        self.b = b
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.PublicKey_cca) + len(self.hash_pk) + self.A.coeffs.nbytes + self.b.coeffs.nbytes
+
+
+class PreparedSecretKey():
+    """
+    Secret key parsed once for repeated decapsulations. Holds the implicit rejection value z, the hash of the public key hash_pk, the decoded secret vector s and the matrix A and the vector b of the embedded public key, which are needed by the re-encryption. The optional decaps_cache holds the session keys of the recently decapsulated ciphertexts.
+    """
+
+    __slots__ = ("z", "hash_pk", "s", "A", "b", "decaps_cache")
+
+    def __init__(self, z: bytes, hash_pk: bytes, s: PolyVec, A: PolyMatrix, b: PolyVec, decaps_cache: Optional[DecapsCache] = None):
+        self.z = z
+        self.hash_pk = hash_pk
+        self.s = s
+        self.A = A
+        self.b = b
+        self.decaps_cache = decaps_cache
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.z) + len(self.hash_pk) + self.s.coeffs.nbytes + self.A.coeffs.nbytes + self.b.coeffs.nbytes
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import random
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.backends import BACKENDS
+from utils.constants import CONSTANTS_MAP
+from kem import KEM
+
+
+# ================================================================
+# Framing. Every request and response is a header followed by a payload.
+# The header holds the payload length, the operation (status in the
+# responses) and the request id chosen by the client, so the requests
+# can be pipelined and the responses may come back out of order.
+
+HEADER = struct.Struct(">IBI")
+
+OP_PUBLIC_KEY = 1
+OP_ENCAPS = 2
+OP_DECAPS = 3
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+MAX_PAYLOAD = 1 << 16
+
+
+class FrameError(ValueError):
+    "Raised by read_frame for a frame which is rejected before its payload is read, the stream is no longer in sync after it."
+
+    def __init__(self, message: str, request_id: int):
+        super().__init__(message)
+        self.request_id = request_id
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    length, code, request_id = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise FrameError(f"The frame payload of {length} bytes exceeds the limit of {MAX_PAYLOAD} bytes.", request_id)
+    return code, request_id, await reader.readexactly(length)
+
+
+def write_frame(writer: asyncio.StreamWriter, code: int, request_id: int, payload: bytes = b''):
+    writer.write(HEADER.pack(len(payload), code, request_id) + payload)
+
+
+# ================================================================
+# Server side.
+
+class MicroBatcher():
+    """
+    Groups the items submitted within window seconds, or up to max_batch items, into one call of the batch function, which runs in the executor so that the event loop never blocks. The batch function maps a list of items to the list of results.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], executor: ThreadPoolExecutor, max_batch: int = 64, window: float = 0.002):
+        assert max_batch > 0, "The maximum batch size should be positive."
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window = window
+        self.batches = 0
+        self.items = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = list()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, item: Any) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, list()
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class KEMServer():
+    """
+    Key exchange server holding one secret key. It answers the public key requests, encapsulates to the given public key (or its own when the payload is empty) and decapsulates the ciphertexts with its secret key. The encapsulations and decapsulations are micro-batched into the batched KEM methods.
+    """
+
+    def __init__(self, kem: KEM, SecretKey_cca: bytes, max_batch: int = 64, window: float = 0.002, workers: int = 1):
+        self.kem = kem
+        self.SecretKey = kem.load_secret_key(SecretKey_cca)
+        self.PublicKey = bytes(SecretKey_cca[kem.params.sk_pk])
+        self.executor = ThreadPoolExecutor(workers)
+        self.encaps_batcher = MicroBatcher(kem.encaps_batch, self.executor, max_batch, window)
+        self.decaps_batcher = MicroBatcher(lambda CipherTexts_cca: kem.decaps_batch(CipherTexts_cca, self.SecretKey), self.executor, max_batch, window)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        try:
+            while True:
+                try:
+                    op, request_id, payload = await read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except FrameError as e:
+                    # The payload is not read, so the connection is answered and closed
+                    write_frame(writer, STATUS_ERROR, e.request_id, str(e).encode())
+                    try:
+                        await writer.drain()
+                    except ConnectionError:
+                        pass
+                    break
+                task = asyncio.ensure_future(self._respond(writer, op, request_id, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, op: int, request_id: int, payload: bytes):
+        try:
+            if op == OP_PUBLIC_KEY:
+                response = self.PublicKey
+            elif op == OP_ENCAPS:
+                PublicKey_cca = payload or self.PublicKey
+                if len(PublicKey_cca) != self.kem.params.public_key_bytes:
+                    raise ValueError("The public key has an incorrect length.")
+                SessionKey_cca, CipherText_cca = await self.encaps_batcher.submit(PublicKey_cca)
+                response = SessionKey_cca + CipherText_cca
+            elif op == OP_DECAPS:
+                if len(payload) != self.kem.params.ciphertext_bytes:
+                    raise ValueError("The ciphertext has an incorrect length.")
+                response = await self.decaps_batcher.submit(payload)
+            else:
+                raise ValueError(f"Unknown operation: {op}.")
+        except Exception as e:
+            write_frame(writer, STATUS_ERROR, request_id, str(e).encode())
+        else:
+            write_frame(writer, STATUS_OK, request_id, response)
+        await writer.drain()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix: Optional[str] = None) -> asyncio.AbstractServer:
+        if unix is not None:
+            return await asyncio.start_unix_server(self.handle, path=unix)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+# ================================================================
+# Client side.
+
+class KEMClient():
+    """
+    Asynchronous client of the KEMServer. The requests are pipelined over a single connection and matched with the responses by their ids.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._next_id = 0
+        self._waiting: Dict[int, asyncio.Future] = dict()
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 8765, unix: Optional[str] = None) -> 'KEMClient':
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                status, request_id, payload = await read_frame(self.reader)
+                future = self._waiting.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload.decode(errors="replace")))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"The connection to the server was lost: {e}"))
+            self._waiting.clear()
+
+    async def request(self, op: int, payload: bytes = b'') -> bytes:
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        write_frame(self.writer, op, request_id, payload)
+        await self.writer.drain()
+        return await future
+
+    async def public_key(self) -> bytes:
+        return await self.request(OP_PUBLIC_KEY)
+
+    async def encaps(self, PublicKey_cca: bytes = b'') -> Tuple[bytes, bytes]:
+        response = await self.request(OP_ENCAPS, PublicKey_cca)
+        return response[:32], response[32:]
+
+    async def decaps(self, CipherText_cca: bytes) -> bytes:
+        return await self.request(OP_DECAPS, CipherText_cca)
+
+    async def close(self):
+        self._reader_task.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+# ================================================================
+# Load generator.
+
+def _percentile(latencies: Sequence[float], q: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _decaps_payloads(kem: KEM, PublicKey_cca: bytes, requests: int, resend_ratio: float, seed: int = 0) -> List[bytes]:
+    # Every request carries a distinct ciphertext, except for the share resend_ratio which repeats a random one sent before
+    rng = random.Random(seed)
+    plan = [i > 0 and rng.random() < resend_ratio for i in range(requests)]
+    distinct = list()
+    for start in range(0, plan.count(False), 256):
+        batch = min(256, plan.count(False) - start)
+        distinct.extend(CipherText_cca for _, CipherText_cca in kem.encaps_batch([PublicKey_cca] * batch))
+
+    payloads, fresh = list(), iter(distinct)
+    for resend in plan:
+        payloads.append(rng.choice(payloads) if resend else next(fresh))
+    return payloads
+
+
+async def run_load(client: KEMClient, op: str = "decaps", requests: int = 1000, concurrency: int = 32, resend_ratio: float = 0.0) -> Dict[str, float]:
+    """
+    Sends the requests with the given number of them in flight, returns the throughput and the latency percentiles in milliseconds. The decapsulation requests carry distinct ciphertexts, apart from the share resend_ratio of them which resends an earlier one, e.g. to measure the decapsulation cache of the server.
+    """
+
+    assert 0 <= resend_ratio <= 1, "The resend ratio should be between 0 and 1."
+
+    PublicKey_cca = await client.public_key()
+    kem = KEM(**next(constants for constants in CONSTANTS_MAP.values() if constants["SABER_PUBLICKEYBYTES"] == len(PublicKey_cca)))
+    payloads = _decaps_payloads(kem, PublicKey_cca, requests, resend_ratio) if op == "decaps" else None
+
+    latencies = list()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for i in remaining:
+            start = time.perf_counter()
+            if op == "decaps":
+                await client.decaps(payloads[i])
+            else:
+                await client.encaps()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "distinct": len(set(payloads)) if payloads is not None else requests,
+        "ops_per_sec": requests / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1e3,
+        "p90_ms": _percentile(latencies, 0.90) * 1e3,
+        "p99_ms": _percentile(latencies, 0.99) * 1e3,
+        "max_ms": max(latencies) * 1e3,
+    }
+
+
+# ================================================================
+# Command line interface.
+
+async def _serve(args: argparse.Namespace):
+    kem = KEM(args.backend, decaps_cache_size=args.decaps_cache, decaps_cache_ttl=args.decaps_cache_ttl, decaps_rejection_ttl=args.decaps_rejection_ttl, **CONSTANTS_MAP[args.params])
+    if args.key is not None:
+        with open(args.key, "rb") as f:
+            SecretKey_cca = f.read()
+    else:
+        _, SecretKey_cca = kem.KeyGen()
+    server = KEMServer(kem, SecretKey_cca, args.max_batch, args.window / 1e3, args.workers)
+    listener = await server.start(args.host, args.port, args.unix)
+    print(f"Serving {args.params} on {args.unix or f'{args.host}:{args.port}'}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+async def _load(args: argparse.Namespace):
+    client = await KEMClient.connect(args.host, args.port, args.unix)
+    try:
+        stats = await run_load(client, args.op, args.requests, args.concurrency, args.resend_ratio)
+    finally:
+        await client.close()
+    print(" ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}" for key, value in stats.items()))
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="SABER key exchange server, client load generator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the key exchange server.")
+    serve.add_argument("--params", choices=sorted(CONSTANTS_MAP), default="default")
+    serve.add_argument("--key", help="File with the SecretKey_cca bytes, a fresh key pair is generated when omitted.")
+    serve.add_argument("--max-batch", type=int, default=64)
+    serve.add_argument("--window", type=float, default=2.0, help="Micro-batching window in milliseconds.")
+    serve.add_argument("--workers", type=int, default=1)
+    serve.add_argument("--backend", choices=sorted(BACKENDS), default="numpy")
+    serve.add_argument("--decaps-cache", type=int, default=0, help="Number of decapsulated session keys kept to answer the retransmitted ciphertexts, 0 disables the cache.")
+    serve.add_argument("--decaps-cache-ttl", type=float, default=30.0, help="Seconds a decapsulated session key is kept.")
+    serve.add_argument("--decaps-rejection-ttl", type=float, default=None, help="Seconds an implicit rejection output is kept, 0 never stores them. Defaults to --decaps-cache-ttl, as a different value lets the latency of a resent ciphertext tell whether it was rejected.")
+
+    load = commands.add_parser("load", help="Generate load against a running server.")
+    load.add_argument("--op", choices=["encaps", "decaps"], default="decaps")
+    load.add_argument("--requests", type=int, default=1000)
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--resend-ratio", type=float, default=0.0, help="Share of the decapsulation requests resending an earlier ciphertext.")
+
+    for command in (serve, load):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8765)
+        command.add_argument("--unix", help="Path of a Unix socket, used instead of TCP.")
+
+    args = parser.parse_args(argv)
+    asyncio.run(_serve(args) if args.command == "serve" else _load(args))
+
+
+if __name__ == "__main__":
+    main()
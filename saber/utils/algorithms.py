@@ -94,12 +94,12 @@ def randombytes(saber_seedbytes: int) -> bytes:
 def poly_mul(a: Polynomial, b: Polynomial, p: int) -> Polynomial:
     "'PolyMul' supporting function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=29.27) specification."
 
-    a_coeffs = a.coeffs
-    b_coeffs = b.coeffs
-    c_coeffs = np.zeros(a.n, dtype=int)
-    for i in range(a.n):
-        c_coeffs[i] = a_coeffs[i] * b_coeffs[i]
-    c = Polynomial(list(c_coeffs), p)
+    # Schoolbook product followed by the reduction modulo x^n + 1 (x^n = -1)
+    n = a.n
+    ab_coeffs = np.convolve(np.array(a.coeffs, dtype=np.int64), np.array(b.coeffs, dtype=np.int64))
+    c_coeffs = ab_coeffs[:n].copy()
+    c_coeffs[:n - 1] -= ab_coeffs[n:]
+    c = Polynomial(list(c_coeffs % p), p)
     return c
 
 
@@ -0,0 +1,70 @@
+from typing import Dict, List
+
+import numpy as np
+
+from utils import algorithms, kronecker, multiplication
+from utils.polynomial import Polynomial
+
+
+class ReferenceBackend():
+    """
+    Ring arithmetic on the Polynomial objects with the functions from algorithms.py, following the specification as closely as possible. The arrays are converted to lists of Polynomial objects and back, the leading batch axes are looped over.
+    """
+
+    @staticmethod
+    def _polys(a: np.ndarray, N: int) -> List[Polynomial]:
+        return [Polynomial([int(c) for c in coeffs], N) for coeffs in a]
+
+    @staticmethod
+    def _coeffs(polys: List[Polynomial]) -> np.ndarray:
+        return np.array([poly.coeffs for poly in polys], dtype=np.uint16)
+
+    def poly_mul(self, a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+        batch = np.broadcast_shapes(a.shape[:-1], b.shape[:-1])
+        a, b = np.broadcast_to(a, batch + a.shape[-1:]), np.broadcast_to(b, batch + b.shape[-1:])
+        c = np.zeros(batch + a.shape[-1:], dtype=np.uint16)
+        for idx in np.ndindex(batch):
+            a_poly, b_poly = self._polys([a[idx], b[idx]], modulus)
+            c[idx] = algorithms.poly_mul(a_poly, b_poly, modulus).coeffs
+        return c
+
+    def matrix_vector_mul(self, M: np.ndarray, v: np.ndarray, modulus: int) -> np.ndarray:
+        batch = np.broadcast_shapes(M.shape[:-3], v.shape[:-2])
+        M, v = np.broadcast_to(M, batch + M.shape[-3:]), np.broadcast_to(v, batch + v.shape[-2:])
+        mv = np.zeros(batch + v.shape[-2:], dtype=np.uint16)
+        for idx in np.ndindex(batch):
+            M_polys = [self._polys(row, modulus) for row in M[idx]]
+            mv[idx] = self._coeffs(algorithms.matrix_vector_mul(M_polys, self._polys(v[idx], modulus), modulus))
+        return mv
+
+    def inner_prod(self, a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+        batch = np.broadcast_shapes(a.shape[:-2], b.shape[:-2])
+        a, b = np.broadcast_to(a, batch + a.shape[-2:]), np.broadcast_to(b, batch + b.shape[-2:])
+        c = np.zeros(batch + a.shape[-1:], dtype=np.uint16)
+        for idx in np.ndindex(batch):
+            c[idx] = algorithms.inner_prod(self._polys(a[idx], modulus), self._polys(b[idx], modulus), modulus).coeffs
+        return c
+
+
+# ================================================================
+# Registry of the ring arithmetic backends. A backend provides poly_mul,
+# matrix_vector_mul and inner_prod with the signatures of the functions in
+# multiplication.py, i.e. on uint16 coefficient arrays batched over the
+# leading axes.
+
+BACKENDS: Dict[str, object] = {
+    "reference": ReferenceBackend(),
+    "numpy": multiplication,
+    "kronecker": kronecker,
+}
+
+
+def register_backend(name: str, backend: object):
+    for attr in ("poly_mul", "matrix_vector_mul", "inner_prod"):
+        assert callable(getattr(backend, attr, None)), f"The backend should provide the {attr} function."
+    BACKENDS[name] = backend
+
+
+def get_backend(name: str) -> object:
+    assert name in BACKENDS, f"Unknown backend: {name}. Available backends: {', '.join(sorted(BACKENDS))}."
+    return BACKENDS[name]
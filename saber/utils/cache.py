@@ -0,0 +1,171 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache():
+    """
+    Bounded, thread-safe least recently used cache. The entries are evicted when either the number of entries exceeds max_entries or the total size reported by the sizeof callable exceeds max_bytes. Setting max_entries to 0 disables the cache.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: Optional[int] = None, sizeof: Callable[[Any], int] = lambda value: 0):
+        assert max_entries >= 0, "The maximum number of entries should be non-negative."
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_entries == 0:
+            return
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= self.sizeof(old)
+            self._entries[key] = value
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        # The factory runs outside of the lock, so concurrent misses for the same key may both compute the value
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self.nbytes -= self.sizeof(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+
+class DecapsCache():
+    """
+    Bounded, thread-safe cache of the session keys decapsulated with one secret key, keyed by r_prime = SHA3-256(CipherText_cca), so that a retransmitted ciphertext skips the decryption and the re-encryption. The entries expire ttl seconds after they are stored, hits do not extend them, and the oldest entries are evicted beyond max_entries.
+
+    The implicit rejection outputs are kept for rejection_ttl seconds, by default the same as ttl, and 0 does not store them at all. A rejection_ttl different from ttl makes the latency of a resubmitted ciphertext tell whether it was rejected, which the implicit rejection otherwise hides.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0, rejection_ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        assert max_entries >= 0, "The maximum number of entries should be non-negative."
+        assert ttl >= 0 and (rejection_ttl is None or rejection_ttl >= 0), "The time to live should be non-negative."
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.rejection_ttl = ttl if rejection_ttl is None else rejection_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # One queue per time to live, so the entries of each expire in insertion order
+        self._accepted = OrderedDict()
+        self._rejected = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, r_prime: bytes) -> Optional[bytes]:
+        with self._lock:
+            now = self.clock()
+            for entries in (self._accepted, self._rejected):
+                entry = entries.get(r_prime)
+                if entry is not None:
+                    if entry[0] > now:
+                        self.hits += 1
+                        return entry[1]
+                    del entries[r_prime]
+                    self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, r_prime: bytes, SessionKey_cca: bytes, rejected: bool = False):
+        ttl = self.rejection_ttl if rejected else self.ttl
+        if self.max_entries == 0 or ttl == 0:
+            return
+
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            entries = self._rejected if rejected else self._accepted
+            entries.pop(r_prime, None)
+            entries[r_prime] = (now + ttl, SessionKey_cca)
+            while len(self._accepted) + len(self._rejected) > self.max_entries:
+                # Evicts the entry which expires first among the heads of both queues
+                if not self._rejected or (self._accepted and next(iter(self._accepted.values()))[0] <= next(iter(self._rejected.values()))[0]):
+                    self._accepted.popitem(last=False)
+                else:
+                    self._rejected.popitem(last=False)
+                self.evictions += 1
+
+    def _expire(self, now: float):
+        for entries in (self._accepted, self._rejected):
+            while entries and next(iter(entries.values()))[0] <= now:
+                entries.popitem(last=False)
+                self.expirations += 1
+
+    def clear(self):
+        with self._lock:
+            self._accepted.clear()
+            self._rejected.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(self.clock())
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._accepted) + len(self._rejected),
+                "rejected_entries": len(self._rejected),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._accepted) + len(self._rejected)
@@ -0,0 +1,218 @@
+import functools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+# ================================================================
+# Per-stage instrumentation of PKE and KEM. The stages are nested, every
+# stage is recorded under its path, e.g. "KEM.Decaps;PKE.Enc;gen_matrix",
+# so the same primitive called from different places is told apart. When
+# disabled, the instrumented functions call through after a single global
+# flag check, stage() returns a shared no-op context manager and the
+# polynomial types skip the allocation counting.
+
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 1e-1, float("inf"))
+
+enabled = False
+tracing = False
+
+_metrics: Dict[str, '_Metric'] = dict()
+_trace: deque = deque(maxlen=100_000)
+_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+class _Metric():
+    __slots__ = ("count", "seconds", "allocations", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.allocations = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class _NullStage():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Stage():
+    __slots__ = ("name", "path", "start", "allocations")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        stack = _stack()
+        self.path = f"{stack[-1].path};{self.name}" if stack else self.name
+        stack.append(self)
+        self.allocations = getattr(_local, "allocations", 0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        _stack().pop()
+        _record(self.path, self.start, end - self.start, getattr(_local, "allocations", 0) - self.allocations)
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _stack() -> List[_Stage]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = list()
+    return stack
+
+
+def _record(path: str, start: float, seconds: float, allocations: int):
+    with _lock:
+        metric = _metrics.get(path)
+        if metric is None:
+            metric = _metrics[path] = _Metric()
+        metric.count += 1
+        metric.seconds += seconds
+        metric.allocations += allocations
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                metric.buckets[i] += 1
+                break
+        if tracing:
+            _trace.append((path, start, seconds, threading.get_ident()))
+
+
+def stage(name: str):
+    "Returns a context manager recording the enclosed code as the named stage, a shared no-op one when the instrumentation is disabled."
+
+    return _Stage(name) if enabled else _NULL_STAGE
+
+
+def instrumented(name: str) -> Callable[[Callable], Callable]:
+    "Decorator recording every call of the function as the named stage."
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_allocation():
+    "Called by the polynomial types on every constructed object while the instrumentation is enabled."
+
+    _local.allocations = getattr(_local, "allocations", 0) + 1
+
+
+def enable(trace: bool = False, max_trace_events: int = 100_000):
+    "Enables the instrumentation, with trace also keeps the individual stage spans for chrome_trace."
+
+    global enabled, tracing, _trace
+    if _trace.maxlen != max_trace_events:
+        _trace = deque(_trace, maxlen=max_trace_events)
+    tracing = trace
+    enabled = True
+
+
+def disable():
+    global enabled, tracing
+    enabled = False
+    tracing = False
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+        _trace.clear()
+
+
+# ================================================================
+# Exporters.
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    "Returns the recorded metrics of every stage path as a plain dictionary, the histogram counts are cumulative like in Prometheus."
+
+    with _lock:
+        result = dict()
+        for path, metric in sorted(_metrics.items()):
+            cumulative, histogram = 0, dict()
+            for bound, count in zip(BUCKETS, metric.buckets):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            result[path] = {
+                "count": metric.count,
+                "seconds": metric.seconds,
+                "mean_seconds": metric.seconds / metric.count,
+                "allocations": metric.allocations,
+                "histogram": histogram,
+            }
+        return result
+
+
+def prometheus_text(prefix: str = "saber") -> str:
+    "Returns the recorded metrics in the Prometheus text exposition format."
+
+    lines = [
+        f"# HELP {prefix}_stage_seconds Time spent in the PKE and KEM stages.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    stats = snapshot()
+    for path, stat in stats.items():
+        for bound, count in stat["histogram"].items():
+            le = "+Inf" if bound == "inf" else bound
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{path}",le="{le}"}} {count}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{path}"}} {stat["seconds"]}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{path}"}} {stat["count"]}')
+    lines.append(f"# HELP {prefix}_stage_allocations_total Polynomial objects constructed in the PKE and KEM stages.")
+    lines.append(f"# TYPE {prefix}_stage_allocations_total counter")
+    for path, stat in stats.items():
+        lines.append(f'{prefix}_stage_allocations_total{{stage="{path}"}} {stat["allocations"]}')
+    return "\n".join(lines) + "\n"
+
+
+def folded_stacks() -> str:
+    "Returns the self time of every stage path in microseconds in the folded stacks format read by flamegraph.pl and speedscope."
+
+    with _lock:
+        self_seconds = {path: metric.seconds for path, metric in _metrics.items()}
+        for path, metric in _metrics.items():
+            parent = path.rpartition(";")[0]
+            if parent in self_seconds:
+                self_seconds[parent] -= metric.seconds
+    return "".join(f"{path} {max(0, round(seconds * 1e6))}\n" for path, seconds in sorted(self_seconds.items()))
+
+
+def chrome_trace(path: Optional[str] = None) -> str:
+    "Returns the spans recorded with enable(trace=True) in the Chrome trace event format read by about:tracing, Perfetto and speedscope, optionally writes them to the file."
+
+    import json
+
+    with _lock:
+        events = [{
+            "name": stage_path.rpartition(";")[2],
+            "cat": stage_path,
+            "ph": "X",
+            "ts": (start - _origin) * 1e6,
+            "dur": seconds * 1e6,
+            "pid": 0,
+            "tid": thread,
+        } for stage_path, start, seconds, thread in _trace]
+    trace = json.dumps({"traceEvents": events})
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(trace)
+    return trace
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+# ================================================================
+# Polynomial multiplication by Kronecker substitution. The coefficients
+# are packed into one Python int as SLOT_BITS-bit slots, i.e. the
+# polynomial is evaluated at x = 2^SLOT_BITS, so the whole product is a
+# single big-int multiplication done by CPython in C. The slots are wide
+# enough to hold every coefficient of a sum of up to 2^16 products of
+# 16-bit coefficients without carries between the slots, so the result
+# is unpacked exactly and reduced modulo x^n + 1 and the modulus.
+#
+# The functions have the same signatures as the ones in multiplication.py
+# and loop over the leading batch axes.
+
+SLOT_BYTES = 6
+SLOT_BITS = 8 * SLOT_BYTES
+
+
+def to_int(a: np.ndarray) -> int:
+    "Packs the non-negative coefficients of a single polynomial into an int."
+
+    slots = a.astype("<u8").view(np.uint8).reshape(-1, 8)[:, :SLOT_BYTES]
+    return int.from_bytes(slots.tobytes(), "little")
+
+
+def from_int(c: int, n: int, modulus: int) -> np.ndarray:
+    "Unpacks the full product of two polynomials of length n from an int and reduces it modulo x^n + 1 and the modulus."
+
+    slots = np.zeros((2*n, 8), dtype=np.uint8)
+    slots[:, :SLOT_BYTES] = np.frombuffer(c.to_bytes(2*n*SLOT_BYTES, "little"), dtype=np.uint8).reshape(2*n, SLOT_BYTES)
+    coeffs = slots.view("<u8").reshape(2*n)
+    return ((coeffs[:n] - coeffs[n:]) & (modulus - 1)).astype(np.uint16)
+
+
+def poly_mul(a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+    "Product of polynomials in Z_modulus[x]/(x^n + 1), batched over the leading axes."
+
+    batch = np.broadcast_shapes(a.shape[:-1], b.shape[:-1])
+    a, b = np.broadcast_to(a, batch + a.shape[-1:]), np.broadcast_to(b, batch + b.shape[-1:])
+    n = a.shape[-1]
+    c = np.zeros(batch + (n, ), dtype=np.uint16)
+    for idx in np.ndindex(batch):
+        c[idx] = from_int(to_int(a[idx]) * to_int(b[idx]), n, modulus)
+    return c
+
+
+def matrix_vector_mul(M: np.ndarray, v: np.ndarray, modulus: int) -> np.ndarray:
+    "Product of the matrices of shape (..., l, l, n) and the vectors of shape (..., l, n) in Z_modulus[x]/(x^n + 1)."
+
+    batch = np.broadcast_shapes(M.shape[:-3], v.shape[:-2])
+    M, v = np.broadcast_to(M, batch + M.shape[-3:]), np.broadcast_to(v, batch + v.shape[-2:])
+    l, n = v.shape[-2:]
+    mv = np.zeros(batch + (l, n), dtype=np.uint16)
+    for idx in np.ndindex(batch):
+        # The vector is packed once and shared by all rows of the matrix
+        v_ints = [to_int(v[idx + (j, )]) for j in range(l)]
+        for i in range(l):
+            mv[idx + (i, )] = from_int(sum(to_int(M[idx + (i, j)]) * v_ints[j] for j in range(l)), n, modulus)
+    return mv
+
+
+def inner_prod(a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+    "Inner product of the vectors of shape (..., l, n) in Z_modulus[x]/(x^n + 1)."
+
+    batch = np.broadcast_shapes(a.shape[:-2], b.shape[:-2])
+    a, b = np.broadcast_to(a, batch + a.shape[-2:]), np.broadcast_to(b, batch + b.shape[-2:])
+    l, n = a.shape[-2:]
+    c = np.zeros(batch + (n, ), dtype=np.uint16)
+    for idx in np.ndindex(batch):
+        c[idx] = from_int(sum(to_int(a[idx + (j, )]) * to_int(b[idx + (j, )]) for j in range(l)), n, modulus)
+    return c
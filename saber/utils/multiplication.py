@@ -0,0 +1,136 @@
+import numpy as np
+
+
+# ================================================================
+# Polynomial multiplication engine for Z_q[x]/(x^n + 1), following the
+# structure of the reference C implementation: Toom-Cook-4 splits the
+# operands in four limbs, the seven limb products are computed with two
+# levels of Karatsuba and the remaining 16 x 16 products with schoolbook.
+#
+# All functions operate on integer arrays whose last axis holds the
+# coefficients by the ascending order of the power of x, any leading axes
+# are treated as a batch and broadcast against each other. The arithmetic
+# is exact over the integers (int64), so the divisions of the Toom-Cook-4
+# interpolation are exact as well and the result can be reduced with any
+# power of two modulus at the very end.
+
+SCHOOLBOOK_THRESHOLD = 16
+
+
+def schoolbook(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    "Full (non-reduced) product of two polynomials of the same length n, returns 2n - 1 coefficients."
+
+    n = a.shape[-1]
+    c = np.zeros(np.broadcast_shapes(a.shape[:-1], b.shape[:-1]) + (2*n - 1, ), dtype=np.int64)
+    for i in range(n):
+        c[..., i:i + n] += a[..., i:i + 1] * b
+    return c
+
+
+def karatsuba(a: np.ndarray, b: np.ndarray, threshold: int = SCHOOLBOOK_THRESHOLD) -> np.ndarray:
+    "Full (non-reduced) product of two polynomials of the same length n, returns 2n - 1 coefficients."
+
+    n = a.shape[-1]
+    if n <= threshold or n % 2:
+        return schoolbook(a, b)
+
+    h = n // 2
+    # The three half-size products are stacked along a new axis and computed in a single recursive call
+    a_0, a_1 = a[..., :h], a[..., h:]
+    b_0, b_1 = b[..., :h], b[..., h:]
+    z = karatsuba(np.stack([a_0, a_1, a_0 + a_1], axis=-2), np.stack([b_0, b_1, b_0 + b_1], axis=-2), threshold)
+    z_0, z_2 = z[..., 0, :], z[..., 1, :]
+    z_1 = z[..., 2, :] - z_0 - z_2
+
+    c = np.zeros(z.shape[:-2] + (2*n - 1, ), dtype=np.int64)
+    c[..., :2*h - 1] += z_0
+    c[..., h:3*h - 1] += z_1
+    c[..., 2*h:] += z_2
+    return c
+
+
+def toom_cook_4_evaluate(a: np.ndarray) -> np.ndarray:
+    "Evaluates the four limbs of the polynomials at the points (inf, 2, 1, -1, 1/2, -1/2, 0), the points 1/2 and -1/2 are scaled by 8. Returns an array of shape (..., 7, n / 4)."
+
+    a = a.astype(np.int64)
+    m = a.shape[-1] // 4
+    a_0, a_1, a_2, a_3 = a[..., :m], a[..., m:2*m], a[..., 2*m:3*m], a[..., 3*m:]
+
+    even, odd = a_0 + a_2, a_1 + a_3
+    even_h, odd_h = 8*a_0 + 2*a_2, 4*a_1 + a_3
+    return np.stack([
+        a_3,
+        a_0 + 2*a_1 + 4*a_2 + 8*a_3,
+        even + odd,
+        even - odd,
+        even_h + odd_h,
+        even_h - odd_h,
+        a_0,
+    ], axis=-2)
+
+
+def toom_cook_4_interpolate(w: np.ndarray) -> np.ndarray:
+    "Recovers the full product of length 2n - 1 from the seven point-wise products of shape (..., 7, n / 2 - 1)."
+
+    w_inf, w_2, w_1, w_m1, w_h, w_mh, w_0 = (w[..., i, :] for i in range(7))
+    c_0, c_6 = w_0, w_inf
+
+    # Even coefficients: c_2 + c_4 and 16 c_2 + 4 c_4
+    u = (w_1 + w_m1) // 2 - c_0 - c_6
+    v = (w_h + w_mh) // 2 - 64*c_0 - c_6
+    c_2 = (v - 4*u) // 12
+    c_4 = u - c_2
+
+    # Odd coefficients: c_1 + c_3 + c_5, 16 c_1 + 4 c_3 + c_5 and c_1 + 4 c_3 + 16 c_5
+    e_1 = (w_1 - w_m1) // 2
+    e_2 = (w_h - w_mh) // 4
+    e_3 = (w_2 - c_0 - 4*c_2 - 16*c_4 - 64*c_6) // 2
+    c_3 = (17*e_1 - e_2 - e_3) // 9
+    c_1_plus_c_5 = e_1 - c_3
+    c_1 = (c_1_plus_c_5 + (e_2 - e_3) // 15) // 2
+    c_5 = c_1_plus_c_5 - c_1
+
+    m = (w.shape[-1] + 1) // 2
+    c = np.zeros(w.shape[:-2] + (8*m - 1, ), dtype=np.int64)
+    for i, c_i in enumerate((c_0, c_1, c_2, c_3, c_4, c_5, c_6)):
+        c[..., i*m:i*m + 2*m - 1] += c_i
+    return c
+
+
+def toom_cook_4(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    "Full (non-reduced) product of two polynomials of the same length n, returns 2n - 1 coefficients."
+
+    return toom_cook_4_interpolate(karatsuba(toom_cook_4_evaluate(a), toom_cook_4_evaluate(b)))
+
+
+def negacyclic_reduce(c: np.ndarray, modulus: int) -> np.ndarray:
+    "Reduces the full product of length 2n - 1 modulo x^n + 1 and the power of two modulus, returns a uint16 array."
+
+    n = (c.shape[-1] + 1) // 2
+    r = c[..., :n].copy()
+    r[..., :n - 1] -= c[..., n:]
+    return (r & (modulus - 1)).astype(np.uint16)
+
+
+def poly_mul(a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+    "Product of polynomials in Z_modulus[x]/(x^n + 1), batched over the leading axes."
+
+    return negacyclic_reduce(toom_cook_4(a, b), modulus)
+
+
+def matrix_vector_mul(M: np.ndarray, v: np.ndarray, modulus: int) -> np.ndarray:
+    "Product of the matrices of shape (..., l, l, n) and the vectors of shape (..., l, n) in Z_modulus[x]/(x^n + 1)."
+
+    # The vector is evaluated once and shared by all rows of the matrix, the row sums are accumulated
+    # in the evaluation domain, so only l interpolations are needed instead of l^2
+    M_w = toom_cook_4_evaluate(M)
+    v_w = toom_cook_4_evaluate(v)
+    w = karatsuba(M_w, v_w[..., np.newaxis, :, :, :]).sum(axis=-3)
+    return negacyclic_reduce(toom_cook_4_interpolate(w), modulus)
+
+
+def inner_prod(a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+    "Inner product of the vectors of shape (..., l, n) in Z_modulus[x]/(x^n + 1)."
+
+    w = karatsuba(toom_cook_4_evaluate(a), toom_cook_4_evaluate(b)).sum(axis=-3)
+    return negacyclic_reduce(toom_cook_4_interpolate(w), modulus)
@@ -0,0 +1,129 @@
+import mmap
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+
+# ================================================================
+# Vectorized codec for the byte strings of Algorithms 9-12 from the SABER
+# specification. A polynomial is serialized from its highest to its lowest
+# coefficient and a vector of polynomials from its last to its first
+# polynomial, each coefficient as a big endian k-bit field. Reversing the
+# whole (l, 256) coefficient array therefore turns (de)serialization into
+# a single pass over a flat stream of k-bit fields.
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap, np.ndarray]
+
+
+def _as_uint8(bs: Buffer) -> np.ndarray:
+    if isinstance(bs, np.ndarray):
+        return bs.view(np.uint8) if bs.dtype != np.uint8 else bs
+    return np.frombuffer(bs, dtype=np.uint8)
+
+
+def view_bytes(bs: Buffer, length: int, writable: bool = False) -> np.ndarray:
+    "Returns a uint8 array sharing the memory of the byte buffer, which should be of the given length, without copying it."
+
+    view = _as_uint8(bs)
+    assert view.ndim == 1 and len(view) == length, f"The buffer should be of length {length} bytes."
+    assert not writable or view.flags.writeable, "The output buffer should be writable."
+    return view
+
+
+def stack_bytes(bss: Sequence[Buffer]) -> np.ndarray:
+    "Stacks N byte strings of the same length into a uint8 array of shape (N, length)."
+
+    return np.frombuffer(b''.join(bss), dtype=np.uint8).reshape(len(bss), -1)
+
+
+def pack_fields(values: np.ndarray, k: int) -> np.ndarray:
+    "Packs the values of shape (..., m) as big endian k-bit fields, returns a uint8 array of shape (..., m * k / 8)."
+
+    assert (values.shape[-1] * k) % 8 == 0, "The packed fields should fill a whole number of bytes."
+    shifts = np.arange(k - 1, -1, -1, dtype=np.uint16)
+    bits = ((values[..., np.newaxis].astype(np.uint16) >> shifts) & 1).astype(np.uint8)
+    return np.packbits(bits.reshape(values.shape[:-1] + (-1, )), axis=-1)
+
+
+def unpack_fields(bs: Buffer, k: int) -> np.ndarray:
+    "Unpacks the big endian k-bit fields of the byte strings of shape (..., m * k / 8), returns a uint16 array of shape (..., m)."
+
+    buf = _as_uint8(bs)
+    assert (buf.shape[-1] * 8) % k == 0, "The byte string should hold a whole number of fields."
+    bits = np.unpackbits(buf, axis=-1).reshape(buf.shape[:-1] + (-1, k))
+    weights = np.uint16(1) << np.arange(k - 1, -1, -1, dtype=np.uint16)
+    return bits @ weights
+
+
+def pack_polvec(coeffs: np.ndarray, k: int) -> np.ndarray:
+    "Serializes the vectors of polynomials of shape (..., l, 256) with k bits per coefficient, returns a uint8 array of shape (..., l * 32 * k)."
+
+    flat = coeffs.reshape(coeffs.shape[:-2] + (-1, ))
+    return pack_fields(flat[..., ::-1], k)
+
+
+def unpack_polvec(bs: Buffer, k: int, l: int) -> np.ndarray:
+    "Deserializes the byte strings of shape (..., l * 32 * k) with k bits per coefficient, returns a uint16 array of shape (..., l, 256)."
+
+    flat = unpack_fields(bs, k)
+    assert flat.shape[-1] == l * 256, "The length of the byte string does not match the vector length."
+    return np.ascontiguousarray(flat[..., ::-1]).reshape(flat.shape[:-1] + (l, 256))
+
+
+def pack_poly(coeffs: np.ndarray, k: int) -> np.ndarray:
+    "Serializes the polynomials of shape (..., 256) with k bits per coefficient, returns a uint8 array of shape (..., 32 * k)."
+
+    return pack_fields(coeffs[..., ::-1], k)
+
+
+def unpack_poly(bs: Buffer, k: int) -> np.ndarray:
+    "Deserializes the byte strings of shape (..., 32 * k) with k bits per coefficient, returns a uint16 array of shape (..., 256)."
+
+    return np.ascontiguousarray(unpack_fields(bs, k)[..., ::-1])
+
+
+# ================================================================
+# Fused rounding and packing for the outputs of Enc and Dec. Rounding a
+# coefficient from e_from to e_to bits keeps its e_to most significant
+# bits, so the coefficients are shifted to the top of a big endian uint16
+# and the wanted bits are taken straight from its unpacked bit planes,
+# without materializing the rounded polynomials.
+
+def _rounded_bits(coeffs: np.ndarray, constant: int, e_from: int, e_to: int) -> np.ndarray:
+    assert 0 < e_to <= e_from <= 16, "The rounding should keep between 1 and e_from <= 16 bits."
+
+    top = (coeffs + np.uint16(constant)) << np.uint16(16 - e_from)
+    bits = np.unpackbits(top.astype(">u2").view(np.uint8), axis=-1)
+    return bits.reshape(coeffs.shape + (16, ))[..., :e_to]
+
+
+# Multiplying a little endian uint64 holding 8 bits, one per byte, by this constant gathers them most significant first into its top byte
+_GATHER_BITS = np.uint64(0x8040201008040201)
+
+
+def _pack_bits(bits: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    if out is None:
+        return np.packbits(bits, axis=-1)
+    shape = bits.shape[:-1] + (bits.shape[-1] // 8, )
+    assert out.shape == shape, f"The output buffer should be of shape {shape}."
+    # np.packbits has no out argument, so the bytes are gathered straight into out instead of packed and copied
+    words = np.ascontiguousarray(bits).view("<u8")
+    np.right_shift(words * _GATHER_BITS, np.uint64(56), out=out, casting="unsafe")
+    return out
+
+
+def pack_rounded_poly(coeffs: np.ndarray, constant: int, e_from: int, e_to: int, out: Optional[np.ndarray] = None, flip: Optional[Buffer] = None) -> np.ndarray:
+    "Same as pack_poly((((coeffs + constant) mod 2^e_from) >> (e_from - e_to)), e_to) for the polynomials of shape (..., 256). The most significant bit of every coefficient is flipped by the bits of the 32-byte messages flip, which equals subtracting the message scaled to 2^(e_from - 1). Writes into out when given."
+
+    bits = _rounded_bits(coeffs[..., ::-1], constant, e_from, e_to)
+    if flip is not None:
+        bits[..., 0] ^= np.unpackbits(_as_uint8(flip), axis=-1)
+    return _pack_bits(bits.reshape(bits.shape[:-2] + (-1, )), out)
+
+
+def pack_rounded_polvec(coeffs: np.ndarray, constant: int, e_from: int, e_to: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    "Same as pack_polvec((((coeffs + constant) mod 2^e_from) >> (e_from - e_to)), e_to) for the vectors of polynomials of shape (..., l, 256). Writes into out when given."
+
+    flat = coeffs.reshape(coeffs.shape[:-2] + (-1, ))
+    bits = _rounded_bits(flat[..., ::-1], constant, e_from, e_to)
+    return _pack_bits(bits.reshape(bits.shape[:-2] + (-1, )), out)
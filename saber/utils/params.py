@@ -0,0 +1,106 @@
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple, Union
+
+from utils.constants import CONSTANTS_MAP
+
+
+# ================================================================
+# Parameter sets with every value derived from the constants of Table 8
+# computed once: the moduli, the rounding shifts and constants and the
+# byte layouts of the keys and the ciphertexts. The objects are immutable
+# and shared process-wide, so a KEM or a PKE costs only the lookup.
+
+class ParameterSet():
+    """
+    Immutable SABER parameter set built from a dictionary of CONSTANTS_MAP. The byte ranges are slices into the corresponding byte strings, e.g. SecretKey_cca[params.sk_pk] is the embedded PublicKey_cca.
+    """
+
+    __slots__ = (
+        "name", "constants",
+        "n", "l", "e_q", "e_p", "e_t", "mu", "q", "p", "t",
+        "h1", "h2", "shift_p", "shift_t", "shift_m",
+        "seed_bytes", "noise_seed_bytes", "key_bytes", "hash_bytes",
+        "indcpa_public_key_bytes", "indcpa_secret_key_bytes", "public_key_bytes", "secret_key_bytes", "ciphertext_bytes",
+        "pk_seed", "pk_b", "ct_m", "ct_b", "sk_z", "sk_hash_pk", "sk_pk", "sk_s",
+    )
+
+    def __init__(self, name: str, constants: Mapping[str, int]):
+        values = dict(name=name, constants=MappingProxyType(dict(constants)))
+
+        values.update(
+            n=constants["SABER_N"], l=constants["SABER_L"], mu=constants["SABER_MU"],
+            e_q=constants["SABER_EQ"], e_p=constants["SABER_EP"], e_t=constants["SABER_ET"],
+            q=2**constants["SABER_EQ"], p=2**constants["SABER_EP"], t=2**constants["SABER_ET"],
+        )
+
+        # Rounding constants h1 and h2 (all coefficients of the constant polynomials are equal) and shifts
+        values.update(
+            h1=2**(constants["SABER_EQ"] - constants["SABER_EP"] - 1),
+            h2=2**(constants["SABER_EP"] - 2) - 2**(constants["SABER_EP"] - constants["SABER_ET"] - 1) + 2**(constants["SABER_EQ"] - constants["SABER_EP"] - 1),
+            shift_p=constants["SABER_EQ"] - constants["SABER_EP"],
+            shift_t=constants["SABER_EP"] - constants["SABER_ET"],
+            shift_m=constants["SABER_EP"] - 1,
+        )
+
+        values.update(
+            seed_bytes=constants["SABER_SEEDBYTES"],
+            noise_seed_bytes=constants["SABER_NOISE_SEEDBYTES"],
+            key_bytes=constants["SABER_KEYBYTES"],
+            hash_bytes=constants["SABER_HASHBYTES"],
+            indcpa_public_key_bytes=constants["SABER_INDCPA_PUBLICKEYBYTES"],
+            indcpa_secret_key_bytes=constants["SABER_INDCPA SECRETKEYBYTES"],
+            public_key_bytes=constants["SABER_PUBLICKEYBYTES"],
+            secret_key_bytes=constants["SABER_SECRETKEYBYTES"],
+            ciphertext_bytes=constants["SABER_BYTES_CCA_DEC"],
+        )
+
+        # PublicKey_cpa = seed_A || b, CipherText_cpa = c_m || b', SecretKey_cca = z || hash_pk || PublicKey_cpa || SecretKey_cpa
+        values.update(
+            pk_seed=slice(0, values["seed_bytes"]),
+            pk_b=slice(values["seed_bytes"], values["indcpa_public_key_bytes"]),
+            ct_m=slice(0, 32 * values["e_t"]),
+            ct_b=slice(32 * values["e_t"], values["ciphertext_bytes"]),
+        )
+        sk_parts = (values["key_bytes"], values["hash_bytes"], values["indcpa_public_key_bytes"], values["indcpa_secret_key_bytes"])
+        assert sum(sk_parts) == values["secret_key_bytes"], "The secret key parts do not add up to SABER_SECRETKEYBYTES."
+        assert 32 * values["l"] * values["e_p"] == values["ciphertext_bytes"] - 32 * values["e_t"], "The ciphertext length does not match SABER_BYTES_CCA_DEC."
+        start = 0
+        for attr, size in zip(("sk_z", "sk_hash_pk", "sk_pk", "sk_s"), sk_parts):
+            values[attr] = slice(start, start + size)
+            start += size
+
+        for attr, value in values.items():
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr: str, value):
+        raise AttributeError("The parameter sets are immutable.")
+
+    def __repr__(self) -> str:
+        return f"ParameterSet({self.name!r})"
+
+
+_parameter_sets: Dict[Union[str, Tuple], ParameterSet] = dict()
+
+
+def get_parameters(params: Union[str, Mapping[str, int], ParameterSet]) -> ParameterSet:
+    "Returns the shared parameter set given by its name in CONSTANTS_MAP or by its constants, building it on the first use."
+
+    if isinstance(params, ParameterSet):
+        return params
+    if not isinstance(params, str):
+        # The constants of a named set resolve to the same shared object as its name
+        name = next((name for name, constants in CONSTANTS_MAP.items() if constants == dict(params)), None)
+        if name is not None:
+            return get_parameters(name)
+
+    key = params if isinstance(params, str) else tuple(sorted(params.items()))
+    parameter_set = _parameter_sets.get(key)
+    if parameter_set is None:
+        if isinstance(params, str):
+            assert params in CONSTANTS_MAP, f"Unknown parameter set: {params}."
+            parameter_set = ParameterSet(params, CONSTANTS_MAP[params])
+        else:
+            parameter_set = ParameterSet("custom", params)
+        # Concurrent first uses may build the set twice, all but one copy are dropped
+        parameter_set = _parameter_sets.setdefault(key, parameter_set)
+    return parameter_set
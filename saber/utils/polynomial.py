@@ -1,7 +1,9 @@
-from typing import Dict, List, Union
+from typing import Dict, Iterator, List, Tuple, Union
 
 import numpy as np
 
+from utils import instrumentation
+
 
 class Polynomial():
     """
@@ -9,6 +11,8 @@ class Polynomial():
     """
 
     def __init__(self, coeffs: Union[Dict, List], N: int):
+        if instrumentation.enabled:
+            instrumentation.count_allocation()
         self.N = N
         self.n = 256
 
@@ -70,3 +74,117 @@ class Polynomial():
     
     def __str__(self) -> str:
         return str(self.np_poly1d)
+
+
+class _PolyArray():
+    """
+    Common base of the array-backed ring elements. The coefficients are kept in a single contiguous uint16 array whose last axis holds the 256 coefficients by the ascending order of the power of x. Since every modulus used by SABER is a power of two not greater than 2^16, the reduction mod N is a bitmask and the wrap-around of the uint16 arithmetic never changes the result mod N.
+    """
+
+    __slots__ = ("coeffs", "N")
+    n = 256
+    ndim = 1
+
+    def __init__(self, coeffs: Union[np.ndarray, List], N: int):
+        assert N & (N - 1) == 0 and 1 < N <= 2**16, "The modulus should be a power of two not greater than 2^16."
+        coeffs = np.asarray(coeffs)
+        assert coeffs.ndim == self.ndim and coeffs.shape[-1] == self.n, f"The coefficients should be an array of shape {('l', ) * (self.ndim - 1) + (self.n, )}."
+        if instrumentation.enabled:
+            instrumentation.count_allocation()
+        self.N = N
+        self.coeffs = coeffs.astype(np.uint16) & (N - 1)
+
+    @classmethod
+    def _wrap(cls, coeffs: np.ndarray, N: int) -> '_PolyArray':
+        # Skips the validation and the reduction, the caller guarantees that the coefficients are already reduced mod N
+        if instrumentation.enabled:
+            instrumentation.count_allocation()
+        obj = object.__new__(cls)
+        obj.coeffs = coeffs
+        obj.N = N
+        return obj
+
+    @classmethod
+    def zeros(cls, shape: Tuple[int, ...], N: int) -> '_PolyArray':
+        return cls._wrap(np.zeros(tuple(shape) + (cls.n, ), dtype=np.uint16), N)
+
+    def __add__(self, other: '_PolyArray') -> '_PolyArray':
+        assert self.N == other.N, "The moduli of the polynomials should be the same."
+        return self._wrap((self.coeffs + other.coeffs) & (self.N - 1), self.N)
+
+    def __sub__(self, other: '_PolyArray') -> '_PolyArray':
+        assert self.N == other.N, "The moduli of the polynomials should be the same."
+        return self._wrap((self.coeffs - other.coeffs) & (self.N - 1), self.N)
+
+    def __mod__(self, N: int) -> '_PolyArray':
+        assert N & (N - 1) == 0 and 1 < N <= 2**16, "The modulus should be a power of two not greater than 2^16."
+        return self._wrap(self.coeffs & (N - 1), N)
+
+    def __lshift__(self, s: int) -> '_PolyArray':
+        return self._wrap((self.coeffs << s) & (self.N - 1), self.N)
+
+    def __rshift__(self, s: int) -> '_PolyArray':
+        return self._wrap(self.coeffs >> s, self.N)
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.N == other.N and np.array_equal(self.coeffs, other.coeffs)
+
+    __hash__ = None
+
+    def __str__(self) -> str:
+        return f"{type(self).__name__}(N={self.N}, coeffs={self.coeffs})"
+
+
+class Poly(_PolyArray):
+    """
+    Array-backed element of the quotient ring Z_N[x]/(x^256 + 1), a compact counterpart of the Polynomial class. The coefficients are stored in a fixed 256-element uint16 array by the ascending order of the power of x.
+    """
+
+    __slots__ = ()
+    ndim = 1
+
+    def __getitem__(self, key) -> int:
+        assert key < self.n, "Index out of bounds. Index should be strictly less than the degree of the polynomial."
+        return int(self.coeffs[key])
+
+
+class PolyVec(_PolyArray):
+    """
+    Vector of l polynomials stored as one contiguous (l, 256) uint16 array.
+    """
+
+    __slots__ = ()
+    ndim = 2
+
+    def __len__(self) -> int:
+        return self.coeffs.shape[0]
+
+    def __getitem__(self, i: int) -> Poly:
+        return Poly._wrap(self.coeffs[i], self.N)
+
+    def __iter__(self) -> Iterator[Poly]:
+        return (self[i] for i in range(len(self)))
+
+
+class PolyMatrix(_PolyArray):
+    """
+    Matrix of l x l polynomials stored as one contiguous (l, l, 256) uint16 array.
+    """
+
+    __slots__ = ()
+    ndim = 3
+
+    def __len__(self) -> int:
+        return self.coeffs.shape[0]
+
+    def __getitem__(self, i: int) -> PolyVec:
+        return PolyVec._wrap(self.coeffs[i], self.N)
+
+    def __iter__(self) -> Iterator[PolyVec]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def T(self) -> 'PolyMatrix':
+        return PolyMatrix._wrap(np.ascontiguousarray(self.coeffs.transpose(1, 0, 2)), self.N)
@@ -0,0 +1,105 @@
+from hashlib import shake_128
+
+from utils.polynomial import Poly, PolyVec, PolyMatrix
+from utils import instrumentation, multiplication, packing, sampling
+from utils.instrumentation import instrumented
+
+
+# ================================================================
+# Counterparts of the supporting functions from algorithms.py operating
+# on the array-backed Poly, PolyVec and PolyMatrix types. The products are
+# computed by the given arithmetic backend, see backends.py.
+
+@instrumented("shiftleft")
+def shiftleft(pin: Poly, s: int) -> Poly:
+    "Algorithm 7 from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=25.36) specification."
+
+    return pin << s
+
+
+@instrumented("shiftright")
+def shiftright(pin: Poly, s: int) -> Poly:
+    "Algorithm 8 from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=25.36) specification."
+
+    return pin >> s
+
+
+@instrumented("bs2pol")
+def bs2pol(bs: bytes) -> Poly:
+    "Algorithm 9 from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=26.51) specification."
+
+    assert len(bs) % 32 == 0, "The length of the byte string should be a multiple of 256 bits."
+    k = len(bs) // 32
+    return Poly._wrap(packing.unpack_poly(bs, k), 2**k)
+
+
+@instrumented("pol2bs")
+def pol2bs(pin: Poly, N: int) -> bytes:
+    "Algorithm 10 from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=26.51) specification."
+
+    assert pin.N == N, "The polynomial modulus is incorrect."
+
+    k = N.bit_length() - 1
+    return packing.pack_poly(pin.coeffs, k).tobytes()
+
+
+@instrumented("bs2polvec")
+def bs2polvec(bs: bytes, l: int) -> PolyVec:
+    "Algorithm 11 from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=26.51) specification."
+
+    assert len(bs) % 32 == 0, "The length of the byte string should be a multiple of 256 bits."
+    k = (len(bs) // 32) // l
+    return PolyVec._wrap(packing.unpack_polvec(bs, k, l), 2**k)
+
+
+@instrumented("polvec2bs")
+def polvec2bs(v: PolyVec, N: int) -> bytes:
+    "Algorithm 12 from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=26.51) specification."
+
+    assert v.N == N, "The polynomial modulus is incorrect."
+
+    k = N.bit_length() - 1
+    return packing.pack_polvec(v.coeffs, k).tobytes()
+
+
+@instrumented("poly_mul")
+def poly_mul(a: Poly, b: Poly, p: int, backend=multiplication) -> Poly:
+    "'PolyMul' supporting function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=29.27) specification."
+
+    return Poly._wrap(backend.poly_mul(a.coeffs, b.coeffs, p), p)
+
+
+@instrumented("matrix_vector_mul")
+def matrix_vector_mul(M: PolyMatrix, v: PolyVec, q: int, backend=multiplication) -> PolyVec:
+    "'MatrixVectorMul' supporting function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=29.49) specification."
+
+    return PolyVec._wrap(backend.matrix_vector_mul(M.coeffs, v.coeffs, q), q)
+
+
+@instrumented("inner_prod")
+def inner_prod(a: PolyVec, b: PolyVec, p: int, backend=multiplication) -> Poly:
+    "'InnerProd' supporting function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=30.09) specification."
+
+    return Poly._wrap(backend.inner_prod(a.coeffs, b.coeffs, p), p)
+
+
+@instrumented("gen_matrix")
+def gen_matrix(seed_a: bytes, l: int, n: int, e_q: int) -> PolyMatrix:
+    "'GenMatrix' supporting function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=30.67) specification."
+
+    with instrumentation.stage("shake_128"):
+        buf = shake_128(seed_a).digest(l * l * n * e_q // 8)
+    return PolyMatrix._wrap(sampling.sample_matrix(buf, l, n, e_q), 2**e_q)
+
+
+@instrumented("gen_secret")
+def gen_secret(seed_s: bytes, l: int, n: int, mu: int, q: int) -> PolyVec:
+    "'GenSecret' supporting function from the [SABER](https://www.esat.kuleuven.be/cosic/pqcrypto/saber/files/saberspecround3.pdf#page=30.84) specification."
+
+    with instrumentation.stage("shake_128"):
+        buf = shake_128(seed_s).digest(l * n * mu // 8)
+    return PolyVec._wrap(sampling.sample_secret(buf, l, n, mu, q), q)
+
+
+def transpose_matrix(matrix: PolyMatrix) -> PolyMatrix:
+    return matrix.T
@@ -0,0 +1,55 @@
+from hashlib import shake_128
+from typing import Sequence
+
+import numpy as np
+
+from utils import instrumentation
+from utils.instrumentation import instrumented
+from utils.packing import Buffer, unpack_fields
+
+
+# ================================================================
+# Vectorized samplers of the GenMatrix and GenSecret supporting functions.
+# They map the SHAKE-128 output directly to coefficient arrays in a fixed
+# number of array operations, the leading axes of the buffers are treated
+# as a batch.
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int16)
+
+
+def sample_matrix(buf: Buffer, l: int, n: int, e_q: int) -> np.ndarray:
+    "Maps the SHAKE-128 output of shape (..., l * l * n * e_q / 8) to the matrices of shape (..., l, l, n) with e_q-bit coefficients."
+
+    coeffs = unpack_fields(buf, e_q)
+    return coeffs.reshape(coeffs.shape[:-1] + (l, l, n))
+
+
+def sample_secret(buf: Buffer, l: int, n: int, mu: int, q: int) -> np.ndarray:
+    "Maps the SHAKE-128 output of shape (..., l * n * mu / 8) to the centered binomial secret vectors of shape (..., l, n) reduced mod q."
+
+    assert mu <= 16, "The Hamming weight lookup table supports fields of at most 8 bits."
+
+    # Each coefficient is the difference of the Hamming weights of two consecutive mu/2-bit fields
+    weights = _POPCOUNT[unpack_fields(buf, mu // 2)]
+    coeffs = weights[..., 0::2] - weights[..., 1::2]
+    return (coeffs.astype(np.uint16) & (q - 1)).reshape(coeffs.shape[:-1] + (l, n))
+
+
+@instrumented("gen_matrix")
+def gen_matrix_batch(seeds_a: Sequence[bytes], l: int, n: int, e_q: int) -> np.ndarray:
+    "GenMatrix for each of the N seeds, returns an array of shape (N, l, l, n)."
+
+    length = l * l * n * e_q // 8
+    with instrumentation.stage("shake_128"):
+        buf = np.frombuffer(b''.join(shake_128(seed_a).digest(length) for seed_a in seeds_a), dtype=np.uint8)
+    return sample_matrix(buf.reshape(len(seeds_a), length), l, n, e_q)
+
+
+@instrumented("gen_secret")
+def gen_secret_batch(seeds_s: Sequence[bytes], l: int, n: int, mu: int, q: int) -> np.ndarray:
+    "GenSecret for each of the N seeds, returns an array of shape (N, l, n) reduced mod q."
+
+    length = l * n * mu // 8
+    with instrumentation.stage("shake_128"):
+        buf = np.frombuffer(b''.join(shake_128(seed_s).digest(length) for seed_s in seeds_s), dtype=np.uint8)
+    return sample_secret(buf.reshape(len(seeds_s), length), l, n, mu, q)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules import each other as top-level modules, same as when the scripts are run from saber/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saber"))
@@ -0,0 +1,128 @@
+import pytest
+
+from kem import KEM
+from server import _decaps_payloads
+from utils.cache import DecapsCache
+
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def tamper(CipherText_cca: bytes) -> bytes:
+    return bytes([CipherText_cca[0] ^ 1]) + CipherText_cca[1:]
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = DecapsCache(8, ttl=10, rejection_ttl=2, clock=clock)
+    cache.put(b"accepted", b"K1")
+    cache.put(b"rejected", b"K2", rejected=True)
+
+    clock.now = 1.9
+    assert cache.get(b"accepted") == b"K1" and cache.get(b"rejected") == b"K2"
+    clock.now = 2.0
+    assert cache.get(b"rejected") is None and cache.get(b"accepted") == b"K1"
+    # A hit does not extend the entry
+    clock.now = 10.0
+    assert cache.get(b"accepted") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["entries"]) == (3, 2, 2, 0)
+
+
+def test_rejection_ttl_defaults_to_ttl():
+    clock = Clock()
+    cache = DecapsCache(8, ttl=5, clock=clock)
+    cache.put(b"rejected", b"K", rejected=True)
+    clock.now = 4.9
+    assert cache.get(b"rejected") == b"K"
+    clock.now = 5.0
+    assert cache.get(b"rejected") is None
+
+
+def test_rejections_are_not_stored_with_zero_ttl():
+    cache = DecapsCache(8, ttl=30, rejection_ttl=0)
+    cache.put(b"rejected", b"K", rejected=True)
+    assert len(cache) == 0 and cache.get(b"rejected") is None
+
+    kem = KEM(params="light", decaps_cache_size=8, decaps_rejection_ttl=0)
+    PublicKey_cca, SecretKey_cca = kem.KeyGen()
+    SecretKey = kem.load_secret_key(SecretKey_cca)
+    SessionKey_cca, CipherText_cca = kem.Encaps(PublicKey_cca)
+    kem.Decaps(tamper(CipherText_cca), SecretKey)
+    kem.decaps_batch([tamper(CipherText_cca)], SecretKey)
+    assert len(SecretKey.decaps_cache) == 0
+    assert kem.Decaps(CipherText_cca, SecretKey) == SessionKey_cca
+    assert SecretKey.decaps_cache.stats()["entries"] == 1
+
+
+def test_eviction_order():
+    clock = Clock()
+    cache = DecapsCache(3, ttl=10, rejection_ttl=1, clock=clock)
+    for key in (b"a", b"b", b"c"):
+        cache.put(key, key.upper())
+        clock.now += 0.1
+    cache.get(b"a")
+    cache.put(b"d", b"D")
+    # The oldest entry goes first, the hit on it does not keep it
+    assert cache.get(b"a") is None and cache.get(b"b") == b"B"
+
+    # The entry expiring first is evicted across the accepted and the rejected entries
+    cache.put(b"r", b"R", rejected=True)
+    assert cache.get(b"r") is None and cache.get(b"b") == b"B"
+    clock.now = 9.5
+    cache.put(b"s", b"S", rejected=True)
+    assert cache.get(b"b") is None and cache.get(b"s") == b"S"
+    cache.put(b"e", b"E")
+    assert cache.get(b"c") is None
+    assert [cache.get(key) for key in (b"d", b"s", b"e")] == [b"D", b"S", b"E"]
+    assert cache.evictions == 4
+
+
+def test_disabled():
+    cache = DecapsCache(0)
+    cache.put(b"a", b"A")
+    assert len(cache) == 0
+    assert KEM(params="light").load_secret_key(KEM(params="light").KeyGen()[1]).decaps_cache is None
+
+
+def test_hits_skip_decryption(monkeypatch):
+    kem = KEM(params="light", decaps_cache_size=16)
+    PublicKey_cca, SecretKey_cca = kem.KeyGen()
+    SecretKey = kem.load_secret_key(SecretKey_cca)
+    results = kem.encaps_batch([PublicKey_cca] * 3)
+    rejected = tamper(results[0][1])
+    expected = KEM(params="light").Decaps(rejected, SecretKey_cca)
+    assert kem.Decaps(results[0][1], SecretKey) == results[0][0]
+    assert kem.decaps_batch([results[1][1], rejected], SecretKey) == [results[1][0], expected]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("PKE.Dec should not run on a cache hit.")
+
+    monkeypatch.setattr(kem.pke, "dec_expanded_into", fail)
+    monkeypatch.setattr(kem.pke, "dec_batch_expanded", fail)
+    assert kem.Decaps(results[1][1], SecretKey) == results[1][0]
+    assert kem.Decaps(rejected, SecretKey) == expected
+    assert kem.decaps_batch([results[0][1], rejected, results[1][1]], SecretKey) == [results[0][0], expected, results[1][0]]
+    with pytest.raises(AssertionError):
+        kem.decaps_batch([results[2][1]], SecretKey)
+
+    monkeypatch.undo()
+    # Only the misses of a batch are decapsulated
+    assert kem.decaps_batch([results[0][1], results[2][1]], SecretKey) == [results[0][0], results[2][0]]
+    stats = SecretKey.decaps_cache.stats()
+    assert stats["entries"] == 4 and stats["hits"] == 6
+
+
+def test_load_payloads():
+    kem = KEM(params="light")
+    PublicKey_cca, _ = kem.KeyGen()
+    assert len(set(_decaps_payloads(kem, PublicKey_cca, 50, 0.0))) == 50
+    payloads = _decaps_payloads(kem, PublicKey_cca, 200, 0.5)
+    assert len(payloads) == 200 and 50 < len(set(payloads)) < 150
+    assert len(set(_decaps_payloads(kem, PublicKey_cca, 20, 1.0))) == 1
@@ -0,0 +1,114 @@
+import io
+
+import pytest
+
+from kem import KEM
+from hybrid import HEADER, MAX_CHUNK_SIZE, decrypt_stream, encrypt_stream
+
+CHUNK_SIZE = 64
+
+
+@pytest.fixture(scope="module")
+def kem():
+    return KEM(params="light")
+
+
+@pytest.fixture(scope="module")
+def key_pairs(kem):
+    return kem.keygen_batch(3)
+
+
+def encrypt(kem, PublicKeys_cca, data, chunk_size=CHUNK_SIZE, workers=1):
+    sink = io.BytesIO()
+    encrypt_stream(kem, PublicKeys_cca, io.BytesIO(data), sink, chunk_size, workers)
+    return sink.getvalue()
+
+
+def decrypt(kem, SecretKey_cca, encrypted, workers=1):
+    sink = io.BytesIO()
+    decrypt_stream(kem, SecretKey_cca, io.BytesIO(encrypted), sink, workers)
+    return sink.getvalue()
+
+
+def header_size(kem, recipients):
+    return HEADER.size + recipients * (kem.params.hash_bytes + kem.params.ciphertext_bytes + 32 + 16)
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, 3 * CHUNK_SIZE, 3 * CHUNK_SIZE + 5])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_round_trip(kem, key_pairs, size, workers):
+    data = bytes(range(256)) * (size // 256 + 1)
+    data = data[:size]
+    encrypted = encrypt(kem, [PublicKey_cca for PublicKey_cca, _ in key_pairs], data, workers=workers)
+    assert len(encrypted) == header_size(kem, len(key_pairs)) + size + (size // CHUNK_SIZE + 1) * 16
+    for _, SecretKey_cca in key_pairs:
+        assert decrypt(kem, SecretKey_cca, encrypted, workers) == data
+
+
+def test_encryptions_differ(kem, key_pairs):
+    PublicKey_cca, SecretKey_cca = key_pairs[0]
+    first, second = encrypt(kem, [PublicKey_cca], b"data"), encrypt(kem, [PublicKey_cca], b"data")
+    assert first != second
+    assert decrypt(kem, SecretKey_cca, first) == decrypt(kem, SecretKey_cca, second) == b"data"
+
+
+@pytest.fixture(scope="module")
+def encrypted(kem, key_pairs):
+    return encrypt(kem, [key_pairs[0][0], key_pairs[1][0]], bytes(3 * CHUNK_SIZE + 5))
+
+
+@pytest.mark.parametrize("position", ["magic", "hash_pk", "ciphertext", "wrapped", "first_chunk", "last_tag"])
+def test_flipped_byte_is_rejected(kem, key_pairs, encrypted, position):
+    offsets = {
+        "magic": 0,
+        "hash_pk": HEADER.size,
+        "ciphertext": HEADER.size + kem.params.hash_bytes + 7,
+        "wrapped": HEADER.size + kem.params.hash_bytes + kem.params.ciphertext_bytes + 3,
+        "first_chunk": header_size(kem, 2),
+        "last_tag": len(encrypted) - 1,
+    }
+    tampered = bytearray(encrypted)
+    tampered[offsets[position]] ^= 1
+    with pytest.raises(ValueError):
+        decrypt(kem, key_pairs[0][1], bytes(tampered))
+
+
+@pytest.mark.parametrize("cut", [1, 16, 21, 5 + 16 + CHUNK_SIZE + 16])
+def test_truncated_file_is_rejected(kem, key_pairs, encrypted, cut):
+    with pytest.raises(ValueError):
+        decrypt(kem, key_pairs[0][1], encrypted[:-cut])
+
+
+def test_truncated_header_is_rejected(kem, key_pairs, encrypted):
+    for size in (HEADER.size - 1, header_size(kem, 2) - 1):
+        with pytest.raises(ValueError):
+            decrypt(kem, key_pairs[0][1], encrypted[:size])
+
+
+def test_dropped_final_record_is_rejected(kem, key_pairs):
+    encrypted = encrypt(kem, [key_pairs[0][0]], bytes(2 * CHUNK_SIZE))
+    with pytest.raises(ValueError):
+        decrypt(kem, key_pairs[0][1], encrypted[:-16])
+
+
+def test_trailing_data_is_rejected(kem, key_pairs, encrypted):
+    with pytest.raises(ValueError):
+        decrypt(kem, key_pairs[0][1], encrypted + b"\0")
+
+
+def test_wrong_recipient_is_rejected(kem, key_pairs, encrypted):
+    with pytest.raises(ValueError):
+        decrypt(kem, key_pairs[2][1], encrypted)
+    with pytest.raises(ValueError):
+        decrypt(KEM(params="default"), KEM(params="default").KeyGen()[1], encrypted)
+
+
+@pytest.mark.parametrize("chunk_size", [0, MAX_CHUNK_SIZE + 1, 2**32 - 1])
+def test_invalid_chunk_size_is_rejected(kem, key_pairs, encrypted, chunk_size):
+    magic, version, l, _, recipients = HEADER.unpack(encrypted[:HEADER.size])
+    crafted = HEADER.pack(magic, version, l, chunk_size, recipients) + encrypted[HEADER.size:]
+    with pytest.raises(ValueError):
+        decrypt(kem, key_pairs[0][1], crafted)
+
+    with pytest.raises(AssertionError):
+        encrypt(kem, [key_pairs[0][0]], b"data", chunk_size)
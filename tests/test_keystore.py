@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from kem import KEM
+from keystore import HEADER_SIZE, MIN_CAPACITY, MAX_LOAD, KeyStore
+
+
+@pytest.fixture(scope="module")
+def kem():
+    return KEM(params="light")
+
+
+@pytest.fixture(scope="module")
+def key_pairs(kem):
+    return kem.keygen_batch(4)
+
+
+def hash_pk(kem, SecretKey_cca):
+    return SecretKey_cca[kem.params.sk_hash_pk]
+
+
+def test_add_and_lookup(kem, key_pairs, tmp_path):
+    path = str(tmp_path / "store")
+    with KeyStore(path, kem) as store:
+        records = [store.add(SecretKey_cca) for _, SecretKey_cca in key_pairs]
+        assert records == list(range(len(key_pairs)))
+        assert store.add(key_pairs[1][1]) == 1
+        assert len(store) == len(key_pairs)
+
+        for record, (PublicKey_cca, SecretKey_cca) in enumerate(key_pairs):
+            assert bytes(store.secret_key(record)) == SecretKey_cca
+            assert bytes(store.secret_key(hash_pk(kem, SecretKey_cca))) == SecretKey_cca
+            assert bytes(store.public_key(hash_pk(kem, SecretKey_cca))) == PublicKey_cca
+            assert record in store and hash_pk(kem, SecretKey_cca) in store
+
+        assert len(key_pairs) not in store and bytes(32) not in store
+        with pytest.raises(KeyError):
+            store.secret_key(bytes(32))
+
+        SessionKey_cca, CipherText_cca = kem.Encaps(key_pairs[2][0])
+        assert store.decaps(CipherText_cca, hash_pk(kem, key_pairs[2][1])) == SessionKey_cca
+
+    with KeyStore(path, kem, writable=False) as store:
+        assert len(store) == len(key_pairs)
+        assert bytes(store.secret_key(hash_pk(kem, key_pairs[3][1]))) == key_pairs[3][1]
+
+
+def test_other_parameter_set_is_rejected(kem, key_pairs, tmp_path):
+    path = str(tmp_path / "store")
+    with KeyStore(path, kem) as store:
+        store.add(key_pairs[0][1])
+    with pytest.raises(ValueError):
+        KeyStore(path, KEM(params="default"))
+
+
+def test_index_rebuild(kem, key_pairs, tmp_path):
+    path = str(tmp_path / "store")
+    with KeyStore(path, kem) as store:
+        for _, SecretKey_cca in key_pairs:
+            store.add(SecretKey_cca)
+
+    os.remove(path + ".idx")
+    with pytest.raises(ValueError):
+        KeyStore(path, kem, writable=False)
+    with KeyStore(path, kem) as store:
+        for record, (_, SecretKey_cca) in enumerate(key_pairs):
+            assert store.record(hash_pk(kem, SecretKey_cca)) == record
+
+    with open(path + ".idx", "r+b") as f:
+        f.write(b"damaged!")
+    with KeyStore(path, kem) as store:
+        assert store.record(hash_pk(kem, key_pairs[2][1])) == 2
+
+
+def test_index_grows(kem, tmp_path):
+    N = int(MIN_CAPACITY * MAX_LOAD) + 1
+    with KeyStore(str(tmp_path / "store"), kem) as store:
+        key_pairs = kem.keygen_batch(N)
+        for _, SecretKey_cca in key_pairs:
+            store.add(SecretKey_cca)
+        assert store._capacity == 2 * MIN_CAPACITY
+        for record in (0, N // 2, N - 1):
+            assert store.record(hash_pk(kem, key_pairs[record][1])) == record
+
+
+def test_torn_record(kem, key_pairs, tmp_path):
+    path = str(tmp_path / "store")
+    with KeyStore(path, kem) as store:
+        store.add(key_pairs[0][1])
+    with open(path, "ab") as f:
+        f.write(key_pairs[1][1][:100])
+
+    with KeyStore(path, kem) as store:
+        assert len(store) == 1
+        assert hash_pk(kem, key_pairs[1][1]) not in store
+        assert store.add(key_pairs[2][1]) == 1
+        assert bytes(store.secret_key(1)) == key_pairs[2][1]
+    assert os.path.getsize(path) == HEADER_SIZE + 2 * kem.params.secret_key_bytes
+
+
+def test_reader_picks_up_appends(kem, key_pairs, tmp_path):
+    path = str(tmp_path / "store")
+    with KeyStore(path, kem) as writer:
+        writer.add(key_pairs[0][1])
+        writer.flush()
+        with KeyStore(path, kem, writable=False) as reader:
+            assert len(reader) == 1
+            for record, (_, SecretKey_cca) in enumerate(key_pairs[1:], 1):
+                writer.add(SecretKey_cca)
+                # The reader shares the index of the writer, the record is found there before it is mapped
+                assert hash_pk(kem, SecretKey_cca) in reader
+                assert bytes(reader.secret_key(hash_pk(kem, SecretKey_cca))) == SecretKey_cca
+                assert bytes(reader.secret_key(record)) == SecretKey_cca
+            assert len(reader) == len(key_pairs)
+
+
+def test_reader_opened_during_append(kem, key_pairs, tmp_path, monkeypatch):
+    path = str(tmp_path / "store")
+    with KeyStore(path, kem) as writer:
+        writer.add(key_pairs[0][1])
+        open_data = KeyStore._open_data
+
+        def open_data_then_append(store):
+            open_data(store)
+            if not store.writable:
+                writer.add(key_pairs[1][1])
+
+        monkeypatch.setattr(KeyStore, "_open_data", open_data_then_append)
+        with KeyStore(path, kem, writable=False) as reader:
+            assert len(reader) == 2
+            assert bytes(reader.secret_key(hash_pk(kem, key_pairs[1][1]))) == key_pairs[1][1]
@@ -0,0 +1,225 @@
+import random
+
+import numpy as np
+import pytest
+
+import kem as kem_module
+import pke as pke_module
+from kem import KEM
+from utils import algorithms, instrumentation, multiplication, packing, ring, sampling
+from utils.backends import BACKENDS
+from utils.params import get_parameters
+from utils.polynomial import Polynomial
+
+
+N = 256
+Q = 2**13
+
+
+def negacyclic_schoolbook(a, b, modulus):
+    "Product in Z_modulus[x]/(x^N + 1) with Python integers, straight from the definition."
+
+    c = [0] * N
+    for i in range(N):
+        for j in range(N):
+            if i + j < N:
+                c[i + j] += a[i] * b[j]
+            else:
+                c[i + j - N] -= a[i] * b[j]
+    return [x % modulus for x in c]
+
+
+def operands():
+    rng = np.random.default_rng(2024)
+    yield rng.integers(0, Q, N), rng.integers(0, Q, N)
+    yield rng.integers(0, 2**16, N), rng.integers(0, 2**16, N)
+    yield np.full(N, Q - 1), np.full(N, Q - 1)
+    yield np.full(N, 2**16 - 1), np.full(N, 2**16 - 1)
+    yield np.full(N, 2**16 - 1), rng.integers(0, Q, N)
+
+
+@pytest.mark.parametrize("a, b", list(operands()))
+def test_poly_mul_matches_schoolbook(a, b):
+    expected = negacyclic_schoolbook([int(x) for x in a], [int(x) for x in b], Q)
+
+    c = multiplication.poly_mul(a.astype(np.uint16), b.astype(np.uint16), Q)
+    assert c.tolist() == expected
+
+    c = algorithms.poly_mul(Polynomial([int(x) for x in a], Q), Polynomial([int(x) for x in b], Q), Q)
+    assert list(c.coeffs) == expected
+
+
+@pytest.mark.parametrize("k", [1, 3, 4, 6, 10, 13])
+def test_packing_matches_reference(k):
+    l = 3
+    rng = np.random.default_rng(k)
+    coeffs = rng.integers(0, 2**k, (l, N)).astype(np.uint16)
+    polys = [Polynomial([int(c) for c in row], 2**k) for row in coeffs]
+
+    bs = algorithms.pol2bs(polys[0], 2**k)
+    assert packing.pack_poly(coeffs[0], k).tobytes() == bs
+    assert np.array_equal(packing.unpack_poly(bs, k), coeffs[0])
+    assert list(algorithms.bs2pol(bs).coeffs) == coeffs[0].tolist()
+
+    bs = algorithms.polvec2bs(polys, 2**k)
+    assert packing.pack_polvec(coeffs, k).tobytes() == bs
+    assert np.array_equal(packing.unpack_polvec(bs, k, l), coeffs)
+    assert [list(poly.coeffs) for poly in algorithms.bs2polvec(bs, l)] == coeffs.tolist()
+
+    # The leading axes are a batch
+    assert np.array_equal(packing.pack_polvec(np.stack([coeffs, coeffs[::-1]]), k)[1], packing.pack_polvec(coeffs[::-1], k))
+
+
+@pytest.mark.parametrize("params", ["light", "default", "fire"])
+def test_samplers_match_reference(params):
+    params = get_parameters(params)
+    seeds = [bytes(range(i, i + 32)) for i in range(3)]
+
+    matrices = [np.array([[poly.coeffs for poly in row] for row in algorithms.gen_matrix(seed, params.l, params.n, params.e_q)]) for seed in seeds]
+    secrets = [np.array([poly.coeffs for poly in algorithms.gen_secret(seed, params.l, params.n, params.mu, params.q)]) for seed in seeds]
+
+    for seed, A, s in zip(seeds, matrices, secrets):
+        assert np.array_equal(ring.gen_matrix(seed, params.l, params.n, params.e_q).coeffs, A)
+        assert np.array_equal(ring.gen_secret(seed, params.l, params.n, params.mu, params.q).coeffs, s)
+    assert np.array_equal(sampling.gen_matrix_batch(seeds, params.l, params.n, params.e_q), np.stack(matrices))
+    assert np.array_equal(sampling.gen_secret_batch(seeds, params.l, params.n, params.mu, params.q), np.stack(secrets))
+
+
+@pytest.mark.parametrize("e_to", [3, 4, 6, 10])
+def test_pack_rounded_into_out(e_to):
+    rng = np.random.default_rng(e_to)
+    coeffs = rng.integers(0, Q, (2, 3, N)).astype(np.uint16)
+    flip = rng.integers(0, 256, (2, 3, 32)).astype(np.uint8)
+
+    expected = packing.pack_rounded_polvec(coeffs, 4, 13, e_to)
+    out = np.empty_like(expected)
+    assert packing.pack_rounded_polvec(coeffs, 4, 13, e_to, out) is out
+    assert np.array_equal(out, expected)
+    assert np.array_equal(expected, packing.pack_polvec(((coeffs + 4) % Q) >> (13 - e_to), e_to))
+
+    expected = packing.pack_rounded_poly(coeffs, 4, 13, e_to, flip=flip)
+    out = np.empty_like(expected)
+    packing.pack_rounded_poly(coeffs, 4, 13, e_to, out, flip)
+    assert np.array_equal(out, expected)
+
+
+def tamper(CipherText_cca):
+    return bytes([CipherText_cca[0] ^ 1]) + CipherText_cca[1:]
+
+
+@pytest.mark.parametrize("params", ["light", "default", "fire"])
+def test_kem_round_trip(params):
+    kem = KEM(params=params)
+    PublicKey_cca, SecretKey_cca = kem.KeyGen()
+    SessionKey_cca, CipherText_cca = kem.Encaps(PublicKey_cca)
+
+    assert len(PublicKey_cca) == kem.params.public_key_bytes
+    assert len(SecretKey_cca) == kem.params.secret_key_bytes
+    assert len(CipherText_cca) == kem.params.ciphertext_bytes
+    assert kem.Decaps(CipherText_cca, SecretKey_cca) == SessionKey_cca
+
+    tampered = bytes([CipherText_cca[0] ^ 1]) + CipherText_cca[1:]
+    assert kem.Decaps(tampered, SecretKey_cca) != SessionKey_cca
+
+
+def seeded_randombytes(seed):
+    rng = random.Random(seed)
+    return lambda n: bytes(rng.getrandbits(8) for _ in range(n))
+
+
+@pytest.mark.parametrize("params", ["light", "default", "fire"])
+def test_pke_batch_matches_single_calls(params):
+    pke = KEM(params=params).pke
+    rng = random.Random(7)
+    key_pairs = [pke.KeyGen() for _ in range(3)]
+    ms = [rng.randbytes(32) for _ in key_pairs]
+    seeds = [rng.randbytes(pke.params.noise_seed_bytes) for _ in key_pairs]
+
+    CipherTexts_cpa = pke.enc_batch(ms, seeds, [PublicKey_cpa for PublicKey_cpa, _ in key_pairs])
+    assert CipherTexts_cpa == [pke.Enc(m, seed, PublicKey_cpa) for m, seed, (PublicKey_cpa, _) in zip(ms, seeds, key_pairs)]
+    assert pke.dec_batch(CipherTexts_cpa, [SecretKey_cpa for _, SecretKey_cpa in key_pairs]) == ms
+
+    # A single expanded key broadcasts over the batch
+    PublicKey_cpa, SecretKey_cpa = key_pairs[0]
+    A, b = pke.expand_public_key(PublicKey_cpa)
+    CipherTexts_cpa = [CipherText_cpa.tobytes() for CipherText_cpa in pke.enc_batch_expanded(ms, seeds, A.coeffs, b.coeffs)]
+    assert CipherTexts_cpa == [pke.Enc(m, seed, PublicKey_cpa) for m, seed in zip(ms, seeds)]
+    s = pke.expand_secret_key(SecretKey_cpa)
+    assert [m.tobytes() for m in pke.dec_batch_expanded(CipherTexts_cpa, s.coeffs)] == [pke.Dec(CipherText_cpa, SecretKey_cpa) for CipherText_cpa in CipherTexts_cpa]
+
+
+@pytest.mark.parametrize("params", ["light", "default", "fire"])
+def test_kem_batch_matches_single_calls(params, monkeypatch):
+    kem = KEM(params=params)
+    key_pairs = [kem.KeyGen() for _ in range(3)]
+    PublicKeys_cca = [PublicKey_cca for PublicKey_cca, _ in key_pairs]
+    SecretKeys_cca = [SecretKey_cca for _, SecretKey_cca in key_pairs]
+
+    for recipients in (PublicKeys_cca, [PublicKeys_cca[0]] * 3):
+        monkeypatch.setattr(kem_module, "randombytes", seeded_randombytes(11))
+        results = kem.encaps_batch(recipients)
+        monkeypatch.setattr(kem_module, "randombytes", seeded_randombytes(11))
+        assert results == [kem.Encaps(PublicKey_cca) for PublicKey_cca in recipients]
+
+    results = kem.encaps_batch(PublicKeys_cca)
+    CipherTexts_cca = [CipherText_cca for _, CipherText_cca in results]
+    CipherTexts_cca.append(tamper(CipherTexts_cca[0]))
+    SecretKeys_cca.append(SecretKeys_cca[0])
+    expected = [kem.Decaps(CipherText_cca, SecretKey_cca) for CipherText_cca, SecretKey_cca in zip(CipherTexts_cca, SecretKeys_cca)]
+    assert expected[:3] == [SessionKey_cca for SessionKey_cca, _ in results]
+    assert kem.decaps_batch(CipherTexts_cca, SecretKeys_cca) == expected
+    assert kem.decaps_batch(CipherTexts_cca, [kem.load_secret_key(SecretKey_cca) for SecretKey_cca in SecretKeys_cca]) == expected
+
+    # A single shared secret key, given as bytes or prepared
+    shared = [CipherTexts_cca[0], CipherTexts_cca[3], CipherTexts_cca[0]]
+    expected = [kem.Decaps(CipherText_cca, SecretKeys_cca[0]) for CipherText_cca in shared]
+    assert kem.decaps_batch(shared, SecretKeys_cca[0]) == expected
+    assert kem.decaps_batch(shared, kem.load_secret_key(SecretKeys_cca[0])) == expected
+
+
+def test_empty_batches():
+    kem = KEM(params="light")
+    PublicKey_cca, SecretKey_cca = kem.KeyGen()
+    assert kem.keygen_batch(0) == kem.encaps_batch([]) == kem.decaps_batch([], SecretKey_cca) == kem.decaps_batch([], []) == []
+
+
+def test_backends_agree(monkeypatch):
+    results = dict()
+    for backend in sorted(BACKENDS):
+        randombytes = seeded_randombytes(1234)
+        monkeypatch.setattr(pke_module, "randombytes", randombytes)
+        monkeypatch.setattr(kem_module, "randombytes", randombytes)
+
+        kem = KEM(backend, params="light")
+        PublicKey_cca, SecretKey_cca = kem.KeyGen()
+        SessionKey_cca, CipherText_cca = kem.Encaps(PublicKey_cca)
+        tampered = bytes([CipherText_cca[0] ^ 1]) + CipherText_cca[1:]
+        results[backend] = (PublicKey_cca, SecretKey_cca, SessionKey_cca, CipherText_cca, kem.Decaps(CipherText_cca, SecretKey_cca), kem.Decaps(tampered, SecretKey_cca))
+
+    reference = results.pop("reference")
+    assert reference[2] == reference[4]
+    for backend, result in results.items():
+        assert result == reference, f"The '{backend}' backend differs from the reference backend."
+
+
+def test_batch_paths_are_instrumented():
+    kem = KEM(params="light")
+    key_pairs = kem.keygen_batch(2)
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        results = kem.encaps_batch([PublicKey_cca for PublicKey_cca, _ in key_pairs])
+        kem.decaps_batch([CipherText_cca for _, CipherText_cca in results], key_pairs[0][1])
+        kem.keygen_batch(2)
+        paths = set(instrumentation.snapshot())
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    for stage in ("gen_secret", "matrix_vector_mul", "inner_prod", "round_pack"):
+        assert f"KEM.encaps_batch;PKE.enc_batch;{stage}" in paths
+        assert f"KEM.decaps_batch;PKE.enc_batch;{stage}" in paths
+    for stage in ("bs2pol", "bs2polvec", "inner_prod", "round_pack"):
+        assert f"KEM.decaps_batch;PKE.dec_batch;{stage}" in paths
+    for stage in ("gen_matrix", "gen_secret", "matrix_vector_mul", "polvec2bs", "round_pack"):
+        assert f"KEM.keygen_batch;PKE.keygen_batch;{stage}" in paths